@@ -3,6 +3,21 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving the project through this module also serves the read-only post endpoints
+(lists, details, comments and likes) with the async views of ``post.async_views``,
+so a worker is not held by a request while it waits on the database or the cache,
+and login with ``users.async_views.LoginView``, which hashes passwords on a thread pool.
+Writes stay on the DRF views, which Django runs in a thread.
+
+Run it with an ASGI server, e.g.::
+
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+    uvicorn config.asgi:application --workers 4
+
+Keep ``CONN_MAX_AGE`` at 0 (the default) under ASGI, as Django recommends, and
+pool connections with PgBouncer instead. ``ASYNC_VIEWS=False`` in the environment keeps the sync views.
+``python manage.py loadtest`` compares this deployment with ``config/wsgi.py``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -12,5 +27,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
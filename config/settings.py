@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -107,6 +107,18 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# users.authentication.ClaimsJWTAuthentication: per-process cache of the active flag, auth status
+# and role of token users, so that opted-in views do not load the user row on every request
+AUTH_STATE_CACHE_TTL = 30
+AUTH_STATE_CACHE_SIZE = 10000
+
+# users.tokens.BlacklistCache: blacklisted refresh token JTIs per process, read incrementally at
+# most every BLACKLIST_CACHE_REFRESH seconds. prune_expired_tokens_task deletes expired
+# outstanding / blacklisted tokens hourly in batches of TOKEN_PRUNE_BATCH_SIZE
+BLACKLIST_CACHE_REFRESH = 5
+BLACKLIST_CACHE_OVERLAP = 60
+TOKEN_PRUNE_BATCH_SIZE = 1000
+
 ROOT_URLCONF = 'config.urls'
 
 JAZZMIN_SETTINGS = {
@@ -264,6 +276,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (users/hashers.py). New passwords use the first hasher; hashes made by the others or
+# with other work factors are upgraded on the next login. users.hashers.Argon2PasswordHasher needs
+# argon2-cffi. `python manage.py bench_hashers` measures login with each of them
+PASSWORD_HASHERS = config('PASSWORD_HASHERS', cast=Csv(), default=','.join([
+    'users.hashers.PBKDF2PasswordHasher',
+    'users.hashers.ScryptPasswordHasher',
+    'users.hashers.Argon2PasswordHasher',
+]))
+PASSWORD_PBKDF2_ITERATIONS = config('PASSWORD_PBKDF2_ITERATIONS', default=870000, cast=int)
+PASSWORD_SCRYPT_WORK_FACTOR = config('PASSWORD_SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int)
+PASSWORD_ARGON2_TIME_COST = config('PASSWORD_ARGON2_TIME_COST', default=2, cast=int)
+PASSWORD_ARGON2_MEMORY_COST = config('PASSWORD_ARGON2_MEMORY_COST', default=102400, cast=int)
+PASSWORD_ARGON2_PARALLELISM = config('PASSWORD_ARGON2_PARALLELISM', default=8, cast=int)
+# Threads hashing for the async login view, 0 for one per CPU
+PASSWORD_HASHING_THREADS = config('PASSWORD_HASHING_THREADS', default=0, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -299,17 +327,129 @@ EMAIL_HOST_PASSWORD = config('EMAIL_PASSWORD')
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
+EMAIL_TIMEOUT = 10
+# Notification workers keep their SMTP connection open between messages (shared/notifications.py)
+EMAIL_CONNECTION_MAX_IDLE = 60
 
 # Instagram_Clone/settings.py
 
 # Celery uchun Redis Backend
-CELERY_BROKER_URL = 'redis://localhost:6379/0'  # Redis URL
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')  # Redis URL
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'  # Redis backend
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'flush-like-buffer': {
+        'task': 'post.tasks.flush_like_buffer_task',
+        'schedule': 5.0,
+    },
+    'flush-notification-queue': {
+        'task': 'shared.tasks.flush_notification_queue_task',
+        'schedule': 2.0,
+    },
+    'prune-expired-tokens': {
+        'task': 'users.tasks.prune_expired_tokens_task',
+        'schedule': 60 * 60,
+    },
+    'expire-upload-sessions': {
+        'task': 'shared.tasks.expire_upload_sessions_task',
+        'schedule': 60 * 60,
+    },
+}
 
+# Outbound email / SMS (shared/notifications.py): queued for send_notification_task, or sent by a
+# small thread pool in the web process when CELERY_BROKER_URL is empty or the broker is down.
+# Transient failures are retried with exponential backoff (seconds, with jitter).
+# shared.notifications.LocmemTransport keeps messages in memory for tests
+NOTIFICATION_TRANSPORTS = {
+    'email': 'shared.notifications.EmailTransport',
+    'sms': 'shared.notifications.TwilioSmsTransport',
+}
+NOTIFICATION_MAX_RETRIES = 5
+NOTIFICATION_RETRY_BACKOFF = 2
+NOTIFICATION_RETRY_BACKOFF_MAX = 300
+NOTIFICATION_THREAD_POOL_SIZE = 4
+NOTIFICATION_THREAD_POOL_QUEUE = 100
+NOTIFICATION_SMS_TIMEOUT = 10
+# Verification codes queued and sent in batches by flush_notification_queue_task (every 2 seconds)
+# instead of one task each; shared.notifications.LocalNotificationQueue for tests
+NOTIFICATION_QUEUE_ENABLED = config('NOTIFICATION_QUEUE_ENABLED', default=False, cast=bool)
+NOTIFICATION_QUEUE_BACKEND = 'shared.notifications.RedisNotificationQueue'
+NOTIFICATION_QUEUE_LOCATION = config('NOTIFICATION_QUEUE_LOCATION', default='redis://localhost:6379/3')
+NOTIFICATION_QUEUE_BATCH_SIZE = 100
+
+# Comment threads: nesting depth and replies shown per level before a "load more" link
+COMMENT_THREAD_MAX_DEPTH = 3
+COMMENT_THREAD_REPLIES_PER_LEVEL = 10
+
+# Total counts of paginated responses (see shared/count_strategy.py)
+PAGINATION_COUNT_STRATEGY = 'shared.count_strategy.AdaptiveCount'
+PAGINATION_EXACT_COUNT_THRESHOLD = 1000
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
+# Home feed: authors with at least FEED_FANOUT_THRESHOLD followers are merged in on read
+# instead of being fanned out to every follower's feed on write
+FEED_FANOUT_THRESHOLD = 10000
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 200
+
+# Write-behind likes (post/like_buffer.py): like toggles are acknowledged from a buffer and written
+# in bulk by flush_like_buffer_task. LocalLikeBuffer only works when the flush runs in the web process
+LIKE_BUFFER_ENABLED = config('LIKE_BUFFER_ENABLED', default=False, cast=bool)
+LIKE_BUFFER_BACKEND = 'post.like_buffer.RedisLikeBuffer'
+LIKE_BUFFER_LOCATION = config('LIKE_BUFFER_LOCATION', default='redis://localhost:6379/2')
+LIKE_BUFFER_FLUSH_BATCH_SIZE = 1000
+
+# Sized, EXIF-free copies generated for post images and profile photos (longest edge in px)
+IMAGE_RENDITION_SIZES = (150, 640, 1080)
+IMAGE_RENDITION_FORMATS = ('webp', 'jpeg')
+IMAGE_RENDITION_QUALITY = 82
+
+# Chunked uploads (shared/uploads.py)
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+UPLOAD_READ_BLOCK_SIZE = 64 * 1024
+# Pending sessions are removed with their part files this many seconds after they were created
+UPLOAD_SESSION_EXPIRY = 24 * 60 * 60
+UPLOAD_SESSION_EXPIRY_BATCH_SIZE = 1000
+UPLOAD_MAX_SIZE = {
+    'post_image': 50 * 1024 * 1024,
+    'user_photo': 10 * 1024 * 1024,
+}
+
+# Media serving (shared/media.py). Blobs are served with an immutable Cache-Control, other media with
+# MEDIA_CACHE_MAX_AGE. MEDIA_SENDFILE_BACKEND hands the transfer to the front server:
+# '' (Django streams the file), 'x-accel-redirect' (nginx, internal location at
+# MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+MEDIA_CACHE_MAX_AGE = 3600
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Cache framework: local memory by default, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and CACHE_LOCATION=redis://localhost:6379/1 in production
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Serialized posts and comments (shared/cache.py), invalidated by post/signals.py.
+# Authors are memoized by version, in a per-process LRU and in the cache
+REPRESENTATION_CACHE_ALIAS = 'default'
+REPRESENTATION_CACHE_TIMEOUT = 300
+REPRESENTATION_MEMO_TIMEOUT = 24 * 60 * 60
+REPRESENTATION_LRU_SIZE = 4096
 
 SITE_ID = 1
 
+
+# Async read-only post views (post/async_views.py) and login (users/async_views.py), switched on by config/asgi.py
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Prometheus metrics (shared/metrics.py): /metrics/ answers requests carrying
+# "Authorization: Bearer <METRICS_TOKEN>" or coming from METRICS_ALLOWED_IPS, and is a 404 otherwise.
+# Behind a reverse proxy REMOTE_ADDR is the proxy's: only list addresses that scrape the app directly
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', cast=Csv(), default='')
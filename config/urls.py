@@ -1,11 +1,14 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 
+from shared.media import serve_media
+from shared.metrics import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Instagram Clone API",
@@ -22,10 +25,14 @@ urlpatterns = [
     path('admin/panel/', admin.site.urls),
     path('api/users/', include('users.urls')),
     path('api/', include('post.urls')),
+    path('api/uploads/', include('shared.urls')),
+    path('metrics/', metrics_view, name='metrics'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
 ]
 
 urlpatterns += static(settings.STATIC_URL , document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL , document_root=settings.MEDIA_ROOT)
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.*)$', serve_media, name='media'),
+]
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PostLike, Post, PostComment, CommentLike
+from .models import PostLike, Post, PostComment, CommentLike, FeedEntry
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
@@ -20,3 +20,8 @@ class PostLikeAdmin(admin.ModelAdmin):
 class CommentLikeAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'comment', 'created_at')
     search_fields = ('id', 'author__username')
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'post', 'created_at')
+    search_fields = ('id', 'user__username')
@@ -0,0 +1,153 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from shared.custom_pagination import KeysetPagination
+from users.authentication import AsyncClaimsJWTAuthentication
+from .feed import FeedPagination
+from .models import Post, PostLike, PostComment, CommentLike
+from .serializers import PostSerializer, PostLikeSerializer, CommentSerializer, CommentLikeSerializers
+
+# Async counterparts of the read-only views in post.views, served instead of them when ASYNC_VIEWS is on
+# (see config/asgi.py). DRF 3.15 views are sync only, so authentication, permissions and error bodies
+# follow the DRF views they replace; responses are always JSON.
+
+
+class AsyncAPIView(View):
+    # None for views that ignore the Authorization header, like login
+    authentication_class = AsyncClaimsJWTAuthentication
+    # IsAuthenticated when True, AllowAny otherwise
+    authentication_required = True
+    serializer_class = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authenticated like DRF's APIView, not session authenticated
+        return csrf_exempt(super(AsyncAPIView, cls).as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        # query_params and build_absolute_uri() for the pagination and the serializers, data for login
+        self.request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        self.authenticator = self.authentication_class() if self.authentication_class else None
+        try:
+            await self.authenticate(self.request)
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            return await handler(self.request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def authenticate(self, request):
+        result = await self.authenticator.aauthenticate(request) if self.authenticator else None
+        request.user = result[0] if result is not None else AnonymousUser()
+        if self.authentication_required and not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+
+    def handle_exception(self, exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+        response = self.respond(data, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response.status_code = 401
+            response['WWW-Authenticate'] = self.authenticator.authenticate_header(self.request)
+        return response
+
+    @staticmethod
+    def respond(data, status=200):
+        return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False,
+                            json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+    async def serialize(self, instance, many=False):
+        # Serializers read the representation caches and can run queries (comment threads, viewer likes),
+        # so they run in the request's thread like the async ORM itself
+        serializer = self.serializer_class(instance, many=many, context={'request': self.request, 'view': self})
+        return await sync_to_async(lambda: serializer.data)()
+
+
+class AsyncListView(AsyncAPIView):
+    pagination_class = KeysetPagination
+
+    async def get(self, request, *args, **kwargs):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(self.get_queryset(), request, self)
+        return self.respond(paginator.get_paginated_data(await self.serialize(page, many=True)))
+
+
+class AsyncRetrieveView(AsyncAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        instance = await self.get_queryset().filter(pk=self.kwargs['pk']).afirst()
+        if instance is None:
+            raise exceptions.NotFound()
+        return self.respond(await self.serialize(instance))
+
+
+class PostListApiView(AsyncListView):
+    serializer_class = PostSerializer
+
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
+
+
+class FeedApiView(AsyncListView):
+    serializer_class = PostSerializer
+    pagination_class = FeedPagination
+
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
+
+
+class PostDetailApiView(AsyncRetrieveView):
+    serializer_class = PostSerializer
+
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
+
+
+class PostCommentListApiView(AsyncListView):
+    serializer_class = CommentSerializer
+
+    def get_queryset(self):
+        post_id = self.kwargs.get("pk")
+        return PostComment.objects.filter(post_id=post_id, parent__isnull=True)
+
+
+class CommentDetailApiView(AsyncRetrieveView):
+    authentication_required = False
+    serializer_class = CommentSerializer
+
+    def get_queryset(self):
+        return PostComment.objects.all()
+
+
+class CommentRepliesListApiView(AsyncListView):
+    serializer_class = CommentSerializer
+    ordering = ('created_at', 'id')
+
+    def get_queryset(self):
+        comment_id = self.kwargs.get('pk')
+        return PostComment.objects.filter(parent_id=comment_id)
+
+
+class PostLikeListApiView(AsyncListView):
+    authentication_required = False
+    serializer_class = PostLikeSerializer
+
+    def get_queryset(self):
+        post_id = self.kwargs.get('pk')
+        return PostLike.objects.filter(post_id=post_id)
+
+
+class CommentLikeListView(AsyncListView):
+    authentication_required = False
+    serializer_class = CommentLikeSerializers
+
+    def get_queryset(self):
+        comment_id = self.kwargs.get('pk')
+        return CommentLike.objects.filter(comment_id=comment_id)
@@ -0,0 +1,59 @@
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from shared.custom_pagination import KeysetPagination, keyset_after
+from users.models import Follow
+from .models import Post, FeedEntry
+
+# Home feed pages are read from the materialized timeline: the user's FeedEntry rows (fanned out on
+# write, feed_user_created_idx), merged with the newest posts of the user and of the followed
+# high-follower authors (posts_author_created_idx, one slice per author). Each source returns at most
+# a page of (created_at, post id) keys past the cursor, so a page never walks the posts table
+
+
+def page_of(queryset, fields, limit, position=None, descending=True):
+    if position is not None:
+        queryset = queryset.filter(keyset_after(fields, position, descending))
+    order = [f'-{field}' if descending else field for field in fields]
+    return queryset.order_by(*order).values_list(*fields)[:limit]
+
+
+def timeline_queries(user, limit, position=None, descending=True):
+    pulled = Follow.objects.filter(
+        follower=user, following__followers_count__gte=settings.FEED_FANOUT_THRESHOLD
+    ).values_list('following_id', flat=True)
+    entries = page_of(FeedEntry.objects.filter(user=user), ('post_created_at', 'post_id'), limit, position, descending)
+    return [entries] + [
+        page_of(Post.objects.filter(author_id=author_id), ('created_at', 'id'), limit, position, descending)
+        for author_id in [user.id, *pulled]
+    ]
+
+
+def timeline(user, limit, position=None, descending=True):
+    # Post ids of the next `limit` posts of the feed past `position`, in feed order
+    queries = timeline_queries(user, limit, position, descending)
+    if connection.features.supports_slicing_ordering_in_compound:
+        keys = queries[0].union(*queries[1:], all=True)
+    else:
+        keys = chain.from_iterable(queries)
+    # A post can come from two sources, e.g. entries fanned out before its author crossed the threshold
+    return [post_id for _, post_id in sorted(set(keys), reverse=descending)[:limit]]
+
+
+class FeedPagination(KeysetPagination):
+    # The view's queryset renders the posts of the page, the timeline decides which they are
+
+    def get_count(self, queryset, request, default):
+        return super(FeedPagination, self).get_count(Post.objects.feed_for(request.user), request, default)
+
+    def page_queryset(self, queryset, request, view=None):
+        cursor = self.read_cursor(request, view)
+        position = cursor["position"] if cursor is not None else None
+        ids = timeline(request.user, self.page_size + 1, position, self.descending != self.reverse)
+        return queryset.filter(id__in=ids).order_by(*self.page_ordering())
+
+    async def apage_queryset(self, queryset, request, view=None):
+        return await sync_to_async(self.page_queryset)(queryset, request, view)
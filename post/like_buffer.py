@@ -0,0 +1,127 @@
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+POST, COMMENT = ('post', 'comment')
+
+# Pending toggles are stored per kind as "<target id>:<user id>" -> "1" (liked) / "0" (unliked);
+# the last toggle wins and flush_likes() writes the final state to the database
+
+
+def entry(target_id, user_id):
+    return f"{target_id}:{user_id}"
+
+
+def parse_entry(field):
+    target_id, user_id = field.split(':')
+    return target_id, user_id
+
+
+class LocalLikeBuffer:
+    # In-process stand-in for tests and single-process development. Entries live in the process that
+    # received the request, so flush_likes() has to run there (e.g. CELERY_TASK_ALWAYS_EAGER)
+
+    def __init__(self, location=None):
+        self.lock = threading.Lock()
+        self.entries = {POST: {}, COMMENT: {}}
+
+    def get_many(self, kind, user_id, target_ids):
+        with self.lock:
+            pending = self.entries[kind]
+            return {target_id: pending[entry(target_id, user_id)] == '1'
+                    for target_id in target_ids if entry(target_id, user_id) in pending}
+
+    def set(self, kind, target_id, user_id, liked):
+        with self.lock:
+            self.entries[kind][entry(target_id, user_id)] = '1' if liked else '0'
+
+    def clear(self, kind, target_id, user_id):
+        with self.lock:
+            self.entries[kind].pop(entry(target_id, user_id), None)
+
+    def pending(self, kind, limit):
+        with self.lock:
+            return dict(list(self.entries[kind].items())[:limit])
+
+    def discard(self, kind, flushed):
+        # Toggles made while the batch was being written stay pending
+        with self.lock:
+            pending = self.entries[kind]
+            for field, value in flushed.items():
+                if pending.get(field) == value:
+                    del pending[field]
+
+
+class RedisLikeBuffer:
+    DISCARD_SCRIPT = """
+        for i, field in ipairs(ARGV) do
+            if i % 2 == 1 and redis.call('HGET', KEYS[1], field) == ARGV[i + 1] then
+                redis.call('HDEL', KEYS[1], field)
+            end
+        end
+    """
+
+    def __init__(self, location):
+        import redis
+
+        self.client = redis.Redis.from_url(location, decode_responses=True)
+        self.discard_script = self.client.register_script(self.DISCARD_SCRIPT)
+
+    @staticmethod
+    def key(kind):
+        return f"like_buffer:{kind}"
+
+    def get_many(self, kind, user_id, target_ids):
+        target_ids = list(target_ids)
+        if not target_ids:
+            return {}
+        values = self.client.hmget(self.key(kind), [entry(target_id, user_id) for target_id in target_ids])
+        return {target_id: value == '1' for target_id, value in zip(target_ids, values) if value is not None}
+
+    def set(self, kind, target_id, user_id, liked):
+        self.client.hset(self.key(kind), entry(target_id, user_id), '1' if liked else '0')
+
+    def clear(self, kind, target_id, user_id):
+        self.client.hdel(self.key(kind), entry(target_id, user_id))
+
+    def pending(self, kind, limit):
+        pending = {}
+        for field, value in self.client.hscan_iter(self.key(kind), count=limit):
+            pending[field] = value
+            if len(pending) >= limit:
+                break
+        return pending
+
+    def discard(self, kind, flushed):
+        args = [item for pair in flushed.items() for item in pair]
+        if args:
+            self.discard_script(keys=[self.key(kind)], args=args)
+
+
+@lru_cache(maxsize=None)
+def load_like_buffer(backend, location):
+    return import_string(backend)(location)
+
+
+def get_like_buffer():
+    # None unless LIKE_BUFFER_ENABLED: likes are then written synchronously
+    if not settings.LIKE_BUFFER_ENABLED:
+        return None
+    return load_like_buffer(settings.LIKE_BUFFER_BACKEND, settings.LIKE_BUFFER_LOCATION)
+
+
+def drop_buffered_like(kind, target_id, user):
+    # An explicit like/unlike supersedes a toggle that has not been flushed yet
+    buffer = get_like_buffer()
+    if buffer is not None:
+        buffer.clear(kind, str(target_id), user.id)
+
+
+def buffered_likes(kind, user, target_ids):
+    # {target id: liked} for the viewer's toggles that are not in the database yet
+    buffer = get_like_buffer()
+    if buffer is None or user is None or not user.is_authenticated:
+        return {}
+    return buffer.get_many(kind, user.id, [str(target_id) for target_id in target_ids])
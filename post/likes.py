@@ -0,0 +1,189 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Post, PostComment, PostLike, CommentLike
+
+# Idempotent like/unlike: the like row and the target's likes_count change in one statement on PostgreSQL.
+# Both return (likes_count, changed, extra target columns) or None when the target does not exist.
+
+LIKE_SQL = """
+    WITH changed AS (
+        INSERT INTO {likes} (id, created_at, updated_at, author_id, {target_column})
+        SELECT %s, %s, %s, %s, id FROM {targets} WHERE id = %s
+        ON CONFLICT (author_id, {target_column}) DO NOTHING
+        RETURNING {target_column}
+    ), updated AS (
+        UPDATE {targets} SET likes_count = likes_count + 1
+        WHERE id IN (SELECT {target_column} FROM changed)
+        RETURNING likes_count{extra}
+    )
+    SELECT likes_count, true{extra} FROM updated
+    UNION ALL
+    SELECT likes_count, false{extra} FROM {targets}
+    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM changed)
+"""
+
+UNLIKE_SQL = """
+    WITH changed AS (
+        DELETE FROM {likes} WHERE author_id = %s AND {target_column} = %s
+        RETURNING {target_column}
+    ), updated AS (
+        UPDATE {targets} SET likes_count = GREATEST(likes_count - 1, 0)
+        WHERE id IN (SELECT {target_column} FROM changed)
+        RETURNING likes_count{extra}
+    )
+    SELECT likes_count, true{extra} FROM updated
+    UNION ALL
+    SELECT likes_count, false{extra} FROM {targets}
+    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM changed)
+"""
+
+# Like model: (target field, target model, extra target columns to return)
+TARGETS = {
+    PostLike: ('post', Post, ()),
+    # parent_id: cached top level comments embed their replies
+    CommentLike: ('comment', PostComment, ('parent_id',)),
+}
+
+
+def statement(template, like_model):
+    target, target_model, extra = TARGETS[like_model]
+    quote = connection.ops.quote_name
+    return template.format(
+        likes=quote(like_model._meta.db_table),
+        targets=quote(target_model._meta.db_table),
+        target_column=quote(like_model._meta.get_field(target).column),
+        extra=''.join(f', {quote(column)}' for column in extra),
+    )
+
+
+def run(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    likes_count, changed, *values = row
+    return likes_count, bool(changed), values
+
+
+def like(like_model, target_id, user):
+    if connection.vendor != 'postgresql':
+        return like_in_transaction(like_model, target_id, user)
+    now = timezone.now()
+    return run(statement(LIKE_SQL, like_model),
+               [like_model._meta.pk.get_default(), now, now, user.id, target_id, target_id])
+
+
+def unlike(like_model, target_id, user):
+    if connection.vendor != 'postgresql':
+        return unlike_in_transaction(like_model, target_id, user)
+    return run(statement(UNLIKE_SQL, like_model), [user.id, target_id, target_id])
+
+
+# Other databases (development): the same result in a transaction of a few statements
+
+def like_in_transaction(like_model, target_id, user):
+    target, target_model, extra = TARGETS[like_model]
+    with transaction.atomic():
+        if not target_model.objects.filter(id=target_id).exists():
+            return None
+        _, changed = like_model.objects.get_or_create(author=user, **{f'{target}_id': target_id})
+        if changed:
+            target_model.change_likes_count(target_id, 1)
+        return fetch_target(target_model, target_id, extra, changed)
+
+
+def unlike_in_transaction(like_model, target_id, user):
+    target, target_model, extra = TARGETS[like_model]
+    with transaction.atomic():
+        if not target_model.objects.filter(id=target_id).exists():
+            return None
+        deleted, _ = like_model.objects.filter(author=user, **{f'{target}_id': target_id}).delete()
+        if deleted:
+            target_model.change_likes_count(target_id, -1)
+        return fetch_target(target_model, target_id, extra, bool(deleted))
+
+
+def fetch_target(target_model, target_id, extra, changed):
+    likes_count, *values = target_model.objects.filter(id=target_id).values_list('likes_count', *extra).get()
+    return likes_count, changed, values
+
+
+# Buffered likes are written in batches. Both return the target id of each row actually inserted or
+# deleted, so likes_count only moves by the rows that changed, whatever else ran in the meantime
+
+INSERT_MANY_SQL = """
+    INSERT INTO {likes} (id, created_at, updated_at, author_id, {target_column})
+    VALUES {values}
+    ON CONFLICT (author_id, {target_column}) DO NOTHING
+    RETURNING {target_column}
+"""
+
+DELETE_MANY_SQL = """
+    DELETE FROM {likes} WHERE (author_id, {target_column}) IN ({values})
+    RETURNING {target_column}
+"""
+
+
+def many_statement(template, like_model, rows, columns):
+    target, _, _ = TARGETS[like_model]
+    quote = connection.ops.quote_name
+    placeholders = '(' + ', '.join(['%s'] * columns) + ')'
+    return template.format(
+        likes=quote(like_model._meta.db_table),
+        target_column=quote(like_model._meta.get_field(target).column),
+        values=', '.join([placeholders] * rows),
+    )
+
+
+def run_many(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [target_id for target_id, in cursor.fetchall()]
+
+
+def insert_likes(like_model, pairs):
+    # pairs: (target id, user id)
+    if not pairs:
+        return []
+    if connection.vendor != 'postgresql':
+        return insert_likes_in_transaction(like_model, pairs)
+    now = timezone.now()
+    params = []
+    for target_id, user_id in pairs:
+        params += [like_model._meta.pk.get_default(), now, now, user_id, target_id]
+    return run_many(many_statement(INSERT_MANY_SQL, like_model, len(pairs), 5), params)
+
+
+def delete_likes(like_model, pairs):
+    if not pairs:
+        return []
+    if connection.vendor != 'postgresql':
+        return delete_likes_in_transaction(like_model, pairs)
+    params = []
+    for target_id, user_id in pairs:
+        params += [user_id, target_id]
+    return run_many(many_statement(DELETE_MANY_SQL, like_model, len(pairs), 2), params)
+
+
+def insert_likes_in_transaction(like_model, pairs):
+    target, _, _ = TARGETS[like_model]
+    inserted = []
+    with transaction.atomic():
+        for target_id, user_id in pairs:
+            _, created = like_model.objects.get_or_create(author_id=user_id, **{f'{target}_id': target_id})
+            if created:
+                inserted.append(target_id)
+    return inserted
+
+
+def delete_likes_in_transaction(like_model, pairs):
+    target, _, _ = TARGETS[like_model]
+    deleted = []
+    with transaction.atomic():
+        for target_id, user_id in pairs:
+            count, _ = like_model.objects.filter(author_id=user_id, **{f'{target}_id': target_id}).delete()
+            if count:
+                deleted.append(target_id)
+    return deleted
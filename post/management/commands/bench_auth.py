@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from post.models import Post
+from post.views import PostListApiView
+from users.authentication import ClaimsJWTAuthentication, auth_states
+from users.models import User, DONE
+
+
+class Command(BaseCommand):
+    help = "Benchmark PostListApiView in process with the full-row JWTAuthentication vs the claims based " \
+           "ClaimsJWTAuthentication, against seeded data (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(username="bench_auth", auth_status=DONE)
+            Post.objects.bulk_create(
+                [Post(author=user, caption="bench", image="post-images/bench.jpg") for _ in range(options['posts'])]
+            )
+            access = user.token()["access"]
+            factory = APIRequestFactory()
+
+            self.stdout.write(f"{'authentication':<28} {'req/s':>8} {'ms/req':>8} {'queries/req':>12}")
+            for authentication in (JWTAuthentication, ClaimsJWTAuthentication):
+                auth_states.clear()
+                view = PostListApiView.as_view(authentication_classes=[authentication])
+                # Warm up: representation caches, the auth state cache
+                view(factory.get('/api/posts/', HTTP_AUTHORIZATION=f"Bearer {access}")).render()
+
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        response = view(factory.get('/api/posts/', HTTP_AUTHORIZATION=f"Bearer {access}"))
+                        response.render()
+                        assert response.status_code == 200, response.content
+                    seconds = time.perf_counter() - started
+
+                self.stdout.write(f"{authentication.__name__:<28} {options['requests'] / seconds:>8.0f} "
+                                  f"{seconds * 1000 / options['requests']:>8.2f} "
+                                  f"{len(queries) / options['requests']:>12.2f}")
+            transaction.set_rollback(True)
@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from post.feed import timeline
+from post.models import Post, FeedEntry
+from users.models import User, Follow, DONE
+
+
+class Command(BaseCommand):
+    help = "Benchmark home feed reads: materialized feed vs a naive JOIN over follows. Seeded data is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--following', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=16)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stdout.write(f"{'posts':>10} {'feed p50':>10} {'feed p95':>10} {'join p50':>10} {'join p95':>10}  (ms)")
+        for size in options['sizes']:
+            with transaction.atomic():
+                feed, join = self.run(size)
+                transaction.set_rollback(True)
+            self.stdout.write(f"{size:>10} {self.p(feed, 50):>10.2f} {self.p(feed, 95):>10.2f} "
+                              f"{self.p(join, 50):>10.2f} {self.p(join, 95):>10.2f}")
+
+    def run(self, size):
+        options = self.options
+        batch_size = options['batch_size']
+        prefix = uuid.uuid4().hex[:8]
+
+        viewer = User.objects.create(username=f"bench_{prefix}_viewer", auth_status=DONE)
+        authors = User.objects.bulk_create(
+            [User(username=f"bench_{prefix}_{i}", auth_status=DONE) for i in range(options['authors'])],
+            batch_size=batch_size,
+        )
+        followed = random.sample(authors, min(options['following'], len(authors)))
+        Follow.objects.bulk_create([Follow(follower=viewer, following=author) for author in followed])
+        followed_ids = {author.id for author in followed}
+
+        for start in range(0, size, batch_size):
+            posts = [
+                Post(author=random.choice(authors), caption=f"bench {start + i}", image="post-images/bench.jpg")
+                for i in range(min(batch_size, size - start))
+            ]
+            Post.objects.bulk_create(posts, batch_size=batch_size)
+            FeedEntry.objects.bulk_create(
+                [FeedEntry(user=viewer, post=post, post_created_at=post.created_at)
+                 for post in posts if post.author_id in followed_ids],
+                batch_size=batch_size,
+            )
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE posts, feed_entries, user_follows")
+
+        page_size = options['page_size']
+        # What FeedApiView reads: the page's keys from the timeline, then its posts by id
+        feed = self.measure(lambda: list(
+            Post.objects.filter(id__in=timeline(viewer, page_size)).order_by('-created_at', '-id')
+        ))
+        join = self.measure(lambda: list(
+            Post.objects.filter(author__followers__follower=viewer).order_by('-created_at', '-id')[:page_size]
+        ))
+        return feed, join
+
+    def measure(self, read):
+        timings = []
+        for _ in range(self.options['repeat']):
+            started = time.perf_counter()
+            read()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    @staticmethod
+    def p(timings, percentile):
+        if len(timings) < 2:
+            return timings[0]
+        return statistics.quantiles(timings, n=100)[percentile - 1]
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from post.models import Post, PostLike, PostComment, CommentLike
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized likes_count / comments_count columns of posts and likes_count of comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--post', action='append', dest='post_ids', default=[],
+                            help="Recount only the given post id and its comments (can be repeated).")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        posts = Post.objects.order_by('id')
+        comments = PostComment.objects.order_by('id')
+        if options['post_ids']:
+            posts = posts.filter(id__in=options['post_ids'])
+            comments = comments.filter(post_id__in=options['post_ids'])
+
+        post_likes = PostLike.objects.filter(post=OuterRef('pk')).values('post') \
+            .annotate(total=Count('id')).values('total')
+        post_comments = PostComment.objects.filter(post=OuterRef('pk')).values('post') \
+            .annotate(total=Count('id')).values('total')
+        comment_likes = CommentLike.objects.filter(comment=OuterRef('pk')).values('comment') \
+            .annotate(total=Count('id')).values('total')
+
+        updated = self.recount(posts, likes_count=Coalesce(Subquery(post_likes), Value(0)),
+                               comments_count=Coalesce(Subquery(post_comments), Value(0)))
+        self.stdout.write(self.style.SUCCESS(f"{updated} posts recounted."))
+
+        updated = self.recount(comments, likes_count=Coalesce(Subquery(comment_likes), Value(0)))
+        self.stdout.write(self.style.SUCCESS(f"{updated} comments recounted."))
+
+    def recount(self, queryset, **counters):
+        updated = 0
+        last_id = None
+        while True:
+            batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            ids = list(batch.values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += queryset.model.objects.filter(id__in=ids).update(**counters)
+            last_id = ids[-1]
+        return updated
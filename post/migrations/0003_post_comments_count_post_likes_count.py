@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2025-03-20 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('post', 'Post')
+    PostLike = apps.get_model('post', 'PostLike')
+    PostComment = apps.get_model('post', 'PostComment')
+
+    likes = PostLike.objects.filter(post=OuterRef('pk')).values('post').annotate(total=Count('id')).values('total')
+    comments = PostComment.objects.filter(post=OuterRef('pk')).values('post').annotate(total=Count('id')).values('total')
+    Post.objects.update(
+        likes_count=Coalesce(Subquery(likes), Value(0)),
+        comments_count=Coalesce(Subquery(comments), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0002_alter_post_options_post_author_post_caption_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
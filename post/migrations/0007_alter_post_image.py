@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:49
+
+import django.core.validators
+import shared.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0006_post_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(storage=shared.storage.media_storage, upload_to='post-images/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'webp', 'svg', 'ico'])]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_likes_count(apps, schema_editor):
+    PostComment = apps.get_model('post', 'PostComment')
+    CommentLike = apps.get_model('post', 'CommentLike')
+
+    likes = CommentLike.objects.filter(comment=OuterRef('pk')).values('comment').annotate(total=Count('id')).values('total')
+    PostComment.objects.update(likes_count=Coalesce(Subquery(likes), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0007_alter_post_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postcomment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
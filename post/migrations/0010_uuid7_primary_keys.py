@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:02
+
+import shared.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commentlike',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='postcomment',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='postlike',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0010_uuid7_primary_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='postcomment',
+            name='comments_thread_idx',
+        ),
+    ]
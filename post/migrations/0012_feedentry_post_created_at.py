@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_post_created_at(apps, schema_editor):
+    FeedEntry = apps.get_model('post', 'FeedEntry')
+    Post = apps.get_model('post', 'Post')
+
+    FeedEntry.objects.update(post_created_at=Subquery(Post.objects.filter(id=OuterRef('post_id')).values('created_at')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0011_remove_comments_thread_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedentry',
+            name='post_created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_post_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='post_created_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-post_created_at', '-post'], name='feed_user_created_idx'),
+        ),
+    ]
@@ -1,16 +1,51 @@
 from django.core.validators import FileExtensionValidator, MaxLengthValidator
+from django.conf import settings
 from django.db import models
-from django.db.models import UniqueConstraint
-from users.models import User
-from shared.models import BaseModel
+from django.db.models import Exists, F, OuterRef, Q, UniqueConstraint, Value
+from django.db.models.functions import Greatest
+from users.models import User, Follow
+from shared.models import BaseModel, AuthorQuerySet, AuthorManager
+from shared.storage import media_storage
+
+class PostQuerySet(AuthorQuerySet):
+    def with_viewer_state(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(viewer_liked=Value(False))
+        return self.annotate(viewer_liked=Exists(PostLike.objects.filter(post=OuterRef('pk'), author=user)))
+
+    def feed_for(self, user):
+        # Every post of the user's feed, for its count. Pages are read from the timeline (post/feed.py)
+        entries = FeedEntry.objects.filter(user=user).values('post_id')
+        pulled = Follow.objects.filter(
+            follower=user, following__followers_count__gte=settings.FEED_FANOUT_THRESHOLD
+        ).values('following_id')
+        return self.filter(Q(id__in=entries) | Q(author_id__in=pulled) | Q(author=user))
+
+
+class PostCommentQuerySet(AuthorQuerySet):
+    def with_viewer_state(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(viewer_liked=Value(False))
+        return self.annotate(viewer_liked=Exists(CommentLike.objects.filter(comment=OuterRef('pk'), author=user)))
+
 
 # Post model
 class Post(BaseModel):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
-    image = models.ImageField(upload_to='post-images/', validators=[FileExtensionValidator(allowed_extensions=["jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp", "svg", "ico"])])
+    image = models.ImageField(upload_to='post-images/', storage=media_storage, validators=[FileExtensionValidator(allowed_extensions=["jpg", "jpeg", "png", "gif", "bmp", "tiff", "webp", "svg", "ico"])])
     caption = models.TextField(validators=[MaxLengthValidator(3000)])
+    image_renditions = models.JSONField(default=dict, blank=True)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    objects = AuthorManager.from_queryset(PostQuerySet)()
 
     class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='posts_created_id_idx'),
+            # Posts of followed high-follower authors merged into the feed, newest first
+            models.Index(fields=['author', 'created_at', 'id'], name='posts_author_created_idx'),
+        ]
         db_table = "posts"
         verbose_name = "post"
         verbose_name_plural = "posts"
@@ -18,6 +53,15 @@ class Post(BaseModel):
     def __str__(self):
         return self.caption[:128]
 
+    # Greatest(): a counter that drifted below the real count must not fail the CHECK constraint on decrement
+    @classmethod
+    def change_likes_count(cls, post_id, delta):
+        cls.objects.filter(id=post_id).update(likes_count=Greatest(F('likes_count') + delta, 0))
+
+    @classmethod
+    def change_comments_count(cls, post_id, delta):
+        cls.objects.filter(id=post_id).update(comments_count=Greatest(F('comments_count') + delta, 0))
+
 
 # PostComment model
 class PostComment(BaseModel):
@@ -25,8 +69,17 @@ class PostComment(BaseModel):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     comment = models.TextField(validators=[MaxLengthValidator(5000)])
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='child', null=True, blank=True)
+    likes_count = models.PositiveIntegerField(default=0)
+
+    objects = AuthorManager.from_queryset(PostCommentQuerySet)()
 
     class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comments_post_created_idx',
+                         condition=Q(parent__isnull=True)),
+            # Replies of a comment, also each level of CommentThread
+            models.Index(fields=['parent', 'created_at', 'id'], name='comments_parent_created_idx'),
+        ]
         db_table = "post_comments"
         verbose_name = "post comment"
         verbose_name_plural = "post comments"
@@ -34,18 +87,27 @@ class PostComment(BaseModel):
     def __str__(self):
         return self.comment[:128]
 
+    @classmethod
+    def change_likes_count(cls, comment_id, delta):
+        cls.objects.filter(id=comment_id).update(likes_count=Greatest(F('likes_count') + delta, 0))
+
 
 # PostLike model
 class PostLike(BaseModel):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="likes")
 
+    objects = AuthorManager()
+
     class Meta:
         constraints = [
             UniqueConstraint(
                 fields=['author', 'post'], name='unique_post_like'
             )
         ]
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='post_likes_post_created_idx'),
+        ]
         db_table = "post_likes"
         verbose_name = "post like"
         verbose_name_plural = "post likes"
@@ -59,15 +121,44 @@ class CommentLike(BaseModel):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     comment = models.ForeignKey(PostComment, on_delete=models.CASCADE, related_name="likes")
 
+    objects = AuthorManager()
+
     class Meta:
         constraints = [
             UniqueConstraint(
                 fields=['author', 'comment'], name='unique_comment_like'
             )
         ]
+        indexes = [
+            models.Index(fields=['comment', 'created_at', 'id'], name='comment_likes_created_idx'),
+        ]
         db_table = "comment_likes"
         verbose_name = "comment like"
         verbose_name_plural = "comment likes"
 
     def __str__(self):
         return f'{self.author.username} likes comment {self.comment.id}'
+
+
+# FeedEntry model: materialized home timeline, one row per (reader, post)
+class FeedEntry(BaseModel):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="feed_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="feed_entries")
+    # Copy of post.created_at: feed pages are keyset paginated on (post_created_at, post) without the posts table
+    post_created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-post_created_at', '-post'], name='feed_user_created_idx'),
+        ]
+        db_table = "feed_entries"
+        verbose_name = "feed entry"
+        verbose_name_plural = "feed entries"
+
+    def __str__(self):
+        return f'{self.post_id} in feed of {self.user_id}'
@@ -1,35 +1,60 @@
+from django.conf import settings
+from django.db import models
+from django.urls import reverse
 from rest_framework import serializers
+from post.like_buffer import POST, COMMENT, buffered_likes
 from post.models import Post, PostComment, PostLike, CommentLike
+from post.threads import CommentThread
+from shared.cache import CachedListSerializer, CachedRepresentationMixin, RepresentationCache
+from shared.custom_pagination import KeysetPagination
+from shared.images import rendition_urls
 from users.serializers import UserSerializer
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(CachedRepresentationMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     author = UserSerializer(read_only=True)
-    post_likes_count = serializers.SerializerMethodField('get_post_likes_count')
-    post_comments_count = serializers.SerializerMethodField('get_post_comments_count')
+    post_likes_count = serializers.IntegerField(source='likes_count', read_only=True)
+    post_comments_count = serializers.IntegerField(source='comments_count', read_only=True)
     me_liked = serializers.SerializerMethodField('get_me_liked')
+    image_renditions = serializers.SerializerMethodField('get_image_renditions')
 
+    representation_cache = RepresentationCache('post')
+    uncached_fields = ('author', 'me_liked')
 
     class Meta:
         model = Post
+        list_serializer_class = CachedListSerializer
         fields = ('id',
                   'author',
                   'image',
+                  'image_renditions',
                   'caption',
                   'created_at',
                   'post_likes_count',
                   'post_comments_count',
                   'me_liked')
-    @staticmethod
-    def get_post_likes_count(obj):
-        return obj.likes.count()
-    @staticmethod
-    def get_post_comments_count(obj):
-        return obj.comments.count()
 
 
+    def prefetch_representations(self, instances):
+        super(PostSerializer, self).prefetch_representations(instances)
+        self.get_buffered_likes([instance.id for instance in instances])
+
+    def to_representation(self, instance):
+        data = super(PostSerializer, self).to_representation(instance)
+        return merge_buffered_like(data, self.get_buffered_likes([instance.id])[str(instance.id)], 'post_likes_count')
+
+    def get_buffered_likes(self, ids):
+        return load_buffered_likes(self.context, POST, ids)
+
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj.image.storage, obj.image_renditions, self.context.get('request'))
+
     def get_me_liked(self, obj):
+        # List views annotate the viewer's like for the whole page in the same query
+        if hasattr(obj, 'viewer_liked'):
+            return obj.viewer_liked
+
         request = self.context.get('request', None)
         if request and request.user.is_authenticated:
             try:
@@ -40,15 +65,53 @@ class PostSerializer(serializers.ModelSerializer):
 
         return False
 
-class CommentSerializer(serializers.ModelSerializer):
+def load_buffered_likes(context, kind, ids):
+    # The viewer's like toggles still waiting in the like buffer, fetched once per id and request
+    loaded = context.setdefault(f'buffered_{kind}_likes', {})
+    missing = [str(object_id) for object_id in ids if str(object_id) not in loaded]
+    if missing:
+        request = context.get('request')
+        found = buffered_likes(kind, request.user if request else None, missing)
+        loaded.update({object_id: found.get(object_id) for object_id in missing})
+    return loaded
+
+
+def merge_buffered_like(data, liked, count_field):
+    if liked is not None and liked != data['me_liked']:
+        data['me_liked'] = liked
+        data[count_field] = max(data[count_field] + (1 if liked else -1), 0)
+    return data
+
+
+class CommentListSerializer(CachedListSerializer):
+
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.prefetch_representations(comments)
+        # The replies of the comments on this page that are not cached, a bounded number per level
+        self.child.get_thread().load([comment for comment in comments if not self.child.is_cached(comment)])
+        representations = super(CommentListSerializer, self).to_representation(comments)
+        if self.child.thread_depth == 0:
+            # Nested replies are merged with their top level comment
+            self.child.merge_buffered_likes(representations)
+        return representations
+
+
+class CommentSerializer(CachedRepresentationMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     author = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField('get_replies')
+    replies_count = serializers.SerializerMethodField('get_replies_count')
+    replies_next = serializers.SerializerMethodField('get_replies_next')
     me_liked= serializers.SerializerMethodField('get_me_liked')
     likes_count = serializers.SerializerMethodField('get_likes_count')
 
+    representation_cache = RepresentationCache('comment')
+    uncached_fields = ('author', 'me_liked')
+
     class Meta:
         model = PostComment
+        list_serializer_class = CommentListSerializer
         fields = ('id',
                   'author',
                   'comment',
@@ -56,24 +119,136 @@ class CommentSerializer(serializers.ModelSerializer):
                   'parent',
                   'created_at',
                   'replies',
+                  'replies_count',
+                  'replies_next',
                   'me_liked',
                   'likes_count')
 
+    def __init__(self, *args, **kwargs):
+        self.thread_depth = kwargs.pop('thread_depth', 0)
+        super(CommentSerializer, self).__init__(*args, **kwargs)
+
+    def to_representation(self, instance):
+        data = super(CommentSerializer, self).to_representation(instance)
+        if self.thread_depth == 0 and not isinstance(self.parent, serializers.ListSerializer):
+            self.merge_buffered_likes([data])
+        return data
+
+    def merge_buffered_likes(self, representations):
+        buffered = load_buffered_likes(self.context, COMMENT,
+                                       [comment_id for data in representations for comment_id in self.tree_ids(data)])
+
+        def merge(data):
+            merge_buffered_like(data, buffered[data['id']], 'likes_count')
+            for reply in data.get('replies') or []:
+                merge(reply)
+
+        for data in representations:
+            merge(data)
+
+    def cache_enabled(self):
+        # Top level comments are cached with their replies
+        return self.thread_depth == 0 and super(CommentSerializer, self).cache_enabled()
+
+    def shared_representation(self, data):
+        shared = super(CommentSerializer, self).shared_representation(data)
+        if data.get('replies'):
+            shared['replies'] = [self.without_viewer_state(reply) for reply in data['replies']]
+        return shared
+
+    @classmethod
+    def without_viewer_state(cls, data):
+        # Replies keep their authors, which are refreshed when the cache entry expires
+        reply = {name: value for name, value in data.items() if name != 'me_liked'}
+        if data.get('replies'):
+            reply['replies'] = [cls.without_viewer_state(nested) for nested in data['replies']]
+        return reply
+
+    def load_viewer_state(self, representations):
+        # One query for the viewer's likes on every cached comment and reply of the page
+        liked = self.context.setdefault('viewer_liked_comments', set())
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            ids = [comment_id for data in representations for comment_id in self.tree_ids(data)]
+            liked.update(str(comment_id) for comment_id in CommentLike.objects.filter(
+                author=request.user, comment_id__in=ids
+            ).values_list('comment_id', flat=True))
+
+    def apply_viewer_state(self, instance, shared):
+        data = self.with_liked(shared, self.context.get('viewer_liked_comments', set()))
+        data['author'] = self.fields['author'].to_representation(instance.author)
+        return data
+
+    def with_liked(self, data, liked):
+        ret = {}
+        for name in self.Meta.fields:
+            if name == 'me_liked':
+                ret[name] = data['id'] in liked
+            elif name == 'replies' and data.get('replies'):
+                ret[name] = [self.with_liked(reply, liked) for reply in data['replies']]
+            else:
+                ret[name] = data.get(name)
+        return ret
+
+    @classmethod
+    def tree_ids(cls, data):
+        yield data['id']
+        for reply in data.get('replies') or []:
+            yield from cls.tree_ids(reply)
+
+    def get_thread(self):
+        thread = self.context.get('comment_thread')
+        if thread is None:
+            request = self.context.get('request')
+            thread = CommentThread(request.user if request else None)
+            self.context['comment_thread'] = thread
+        return thread
+
+    def get_shown_replies(self, obj):
+        thread = self.get_thread()
+        thread.get(obj)
+        if self.thread_depth >= settings.COMMENT_THREAD_MAX_DEPTH:
+            return []
+        return thread.replies(obj.id)[:settings.COMMENT_THREAD_REPLIES_PER_LEVEL]
+
     def get_replies(self, obj):
-        if obj.child.exists():
-            serializer = self.__class__(obj.child.all(), many=True, context=self.context)
+        replies = self.get_shown_replies(obj)
+        if replies:
+            serializer = self.__class__(replies, many=True, context=self.context, thread_depth=self.thread_depth + 1)
             return serializer.data
         else:
             return None
+
+    def get_replies_count(self, obj):
+        self.get_thread().get(obj)
+        return self.get_thread().replies_count(obj.id)
+
+    def get_replies_next(self, obj):
+        shown = len(self.get_shown_replies(obj))
+        if self.get_replies_count(obj) <= shown:
+            return None
+
+        url = reverse('comment_replies', kwargs={'pk': obj.id})
+        if shown:
+            last = self.get_shown_replies(obj)[-1]
+            cursor = KeysetPagination.encode_cursor((last.created_at, last.id))
+            url = f"{url}?cursor={cursor}&page_size={shown}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
     def get_me_liked(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return obj.likes.filter(author=user).exists()
+        node = self.get_thread().get(obj)
+        if hasattr(node, 'viewer_liked'):
+            return node.viewer_liked
+
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return obj.likes.filter(author=request.user).exists()
         else:
             return False
-    @staticmethod
-    def get_likes_count(obj):
-        return obj.likes.count()
+
+    def get_likes_count(self, obj):
+        return self.get_thread().get(obj).likes_count
 
 class CommentLikeSerializers(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
@@ -81,6 +256,7 @@ class CommentLikeSerializers(serializers.ModelSerializer):
 
     class Meta:
         model = CommentLike
+        list_serializer_class = CachedListSerializer
         fields = ('id',
                   'author',
                   'comment')
@@ -91,6 +267,7 @@ class PostLikeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PostLike
+        list_serializer_class = CachedListSerializer
         fields = ('id',
                   'author',
                   'post')
\ No newline at end of file
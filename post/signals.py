@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shared.images import delete_renditions
+from .models import Post, PostComment, PostLike, CommentLike
+from .serializers import PostSerializer, CommentSerializer
+
+
+def invalidate(serializer_class, *ids):
+    # After commit, so a concurrent read cannot cache the previous state again
+    transaction.on_commit(lambda: serializer_class.representation_cache.invalidate(ids))
+
+
+def comment_and_ancestors(comment_id, parent_id):
+    # Top level comments are cached with their replies, so every ancestor embeds this comment
+    ids = [comment_id]
+    while parent_id is not None and parent_id not in ids:
+        ids.append(parent_id)
+        parent_id = PostComment.objects.filter(id=parent_id).values_list('parent_id', flat=True).first()
+    return ids
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    invalidate(PostSerializer, instance.id)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    # Also for posts deleted by a cascade or a queryset delete: the blob references of the image and its renditions
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+    delete_renditions(instance.image.storage, instance.image_renditions)
+
+
+@receiver([post_save, post_delete], sender=PostComment)
+def invalidate_comment(sender, instance, **kwargs):
+    invalidate(CommentSerializer, *comment_and_ancestors(instance.id, instance.parent_id))
+    # comments_count
+    invalidate(PostSerializer, instance.post_id)
+
+
+@receiver(post_delete, sender=PostComment)
+def decrement_comments_count(sender, instance, origin=None, **kwargs):
+    # Every deleted comment counts, replies removed by a cascade included. Not when the post goes too
+    if isinstance(origin, Post) and origin.id == instance.post_id:
+        return
+    Post.change_comments_count(instance.post_id, -1)
+
+
+@receiver([post_save, post_delete], sender=PostLike)
+def invalidate_post_like(sender, instance, **kwargs):
+    # likes_count
+    invalidate(PostSerializer, instance.post_id)
+
+
+@receiver([post_save, post_delete], sender=CommentLike)
+def invalidate_comment_like(sender, instance, **kwargs):
+    parent_id = PostComment.objects.filter(id=instance.comment_id).values_list('parent_id', flat=True).first()
+    invalidate(CommentSerializer, *comment_and_ancestors(instance.comment_id, parent_id))
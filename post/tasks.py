@@ -0,0 +1,119 @@
+from collections import Counter
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from shared.images import build_renditions, delete_renditions
+from users.models import User, Follow
+from .like_buffer import POST, COMMENT, get_like_buffer, parse_entry
+from .likes import insert_likes, delete_likes
+from .models import Post, PostComment, PostLike, CommentLike, FeedEntry
+from .serializers import PostSerializer, CommentSerializer
+from .signals import invalidate, comment_and_ancestors
+
+
+@shared_task
+def fan_out_post_task(post_id):
+    post = Post.objects.filter(id=post_id).select_related('author').first()
+    if post is None or post.author.followers_count >= settings.FEED_FANOUT_THRESHOLD:
+        # High-follower authors are merged into the feed on read
+        return 0
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id) \
+        .values_list('follower_id', flat=True) \
+        .iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE)
+
+    created = 0
+    batch = []
+    for follower_id in follower_ids:
+        batch.append(FeedEntry(user_id=follower_id, post_id=post.id, post_created_at=post.created_at))
+        if len(batch) >= settings.FEED_FANOUT_BATCH_SIZE:
+            created += len(FeedEntry.objects.bulk_create(batch, ignore_conflicts=True))
+            batch = []
+    if batch:
+        created += len(FeedEntry.objects.bulk_create(batch, ignore_conflicts=True))
+
+    return created
+
+
+@shared_task
+def backfill_feed_task(user_id, author_id):
+    if User.objects.filter(id=author_id, followers_count__gte=settings.FEED_FANOUT_THRESHOLD).exists():
+        return 0
+
+    posts = Post.objects.filter(author_id=author_id).order_by('-created_at', '-id') \
+        .values_list('id', 'created_at')[:settings.FEED_BACKFILL_SIZE]
+    entries = [FeedEntry(user_id=user_id, post_id=post_id, post_created_at=created_at) for post_id, created_at in posts]
+    return len(FeedEntry.objects.bulk_create(entries, ignore_conflicts=True))
+
+
+@shared_task
+def remove_author_from_feed_task(user_id, author_id):
+    deleted, _ = FeedEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+    return deleted
+
+
+@shared_task
+def process_post_image_task(post_id):
+    post = Post.objects.filter(id=post_id).first()
+    if post is None or not post.image:
+        return
+
+    renditions = build_renditions(post.image)
+    # Skip the update if the image was replaced while this task was running
+    updated = Post.objects.filter(id=post.id, image=post.image.name).update(image_renditions=renditions)
+    if updated:
+        # queryset update: no post_save signal to drop the cached representation
+        invalidate(PostSerializer, post.id)
+        delete_renditions(post.image.storage, post.image_renditions)
+    else:
+        delete_renditions(post.image.storage, renditions)
+
+
+@shared_task
+def flush_like_buffer_task():
+    # Periodic (CELERY_BEAT_SCHEDULE): writes buffered like toggles to the database
+    if get_like_buffer() is None:
+        return 0
+    return flush_likes(POST) + flush_likes(COMMENT)
+
+
+def flush_likes(kind):
+    buffer = get_like_buffer()
+    pending = buffer.pending(kind, settings.LIKE_BUFFER_FLUSH_BATCH_SIZE)
+    if not pending:
+        return 0
+
+    model, target_model = (PostLike, Post) if kind == POST else (CommentLike, PostComment)
+    toggles = {parse_entry(field): value == '1' for field, value in pending.items()}
+    target_ids = {target_id for target_id, _ in toggles}
+    # Toggles of posts, comments or users deleted in the meantime are dropped
+    targets = {str(pk) for pk in target_model.objects.filter(id__in=target_ids).values_list('id', flat=True)}
+    users = {str(pk) for pk in User.objects.filter(id__in={user_id for _, user_id in toggles}).values_list('id', flat=True)}
+    toggles = {pair: liked for pair, liked in toggles.items() if pair[0] in targets and pair[1] in users}
+
+    if toggles:
+        with transaction.atomic():
+            # Only the rows that were really inserted or deleted count: a pair liked or unliked
+            # by a concurrent request or flush in the meantime leaves likes_count alone
+            inserted = insert_likes(model, [pair for pair, liked in toggles.items() if liked])
+            deleted = delete_likes(model, [pair for pair, liked in toggles.items() if not liked])
+
+            deltas = Counter(str(target_id) for target_id in inserted)
+            deltas.subtract(str(target_id) for target_id in deleted)
+            if kind == POST:
+                for post_id, delta in deltas.items():
+                    if delta:
+                        Post.change_likes_count(post_id, delta)
+                invalidate(PostSerializer, *deltas)
+            else:
+                for comment_id, delta in deltas.items():
+                    if delta:
+                        PostComment.change_likes_count(comment_id, delta)
+                    parent_id = PostComment.objects.filter(id=comment_id).values_list('parent_id', flat=True).first()
+                    invalidate(CommentSerializer, *comment_and_ancestors(comment_id, parent_id))
+
+    # Entries toggled again while this batch was written stay in the buffer
+    buffer.discard(kind, pending)
+    return len(pending)
@@ -1,3 +1,528 @@
-from django.test import TestCase
+import base64
+import json
+import re
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from post.like_buffer import POST, get_like_buffer
+from post import async_views
+from post.feed import timeline_queries
+from post.models import Post, PostComment, PostLike, CommentLike, FeedEntry
+from post.tasks import fan_out_post_task, flush_likes
+from post.threads import CommentThread
+from post.views import (
+    PostListApiView, PostCommentListApiView, CommentRepliesListApiView,
+    PostLikeListApiView, CommentLikeListView,
+)
+from shared.custom_pagination import KeysetPagination
+from users.authentication import auth_states
+from users.models import User, UserConfirmation, DONE, VIA_EMAIL
+from users.serializers import UserSerializer
+from users.tokens import UserRefreshToken, blacklisted_tokens, issue_tokens
+
+
+def clear_representation_caches():
+    cache.clear()
+    UserSerializer.memo.local.clear()
+
+
+class ViewerLikesQueryCountTests(APITestCase):
+    # The viewer's likes are resolved for the whole page, not with a query per row
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        author = User.objects.create(username="author", auth_status=DONE)
+        cls.posts = Post.objects.bulk_create(
+            [Post(author=author, caption=f"post {i}", image="post-images/test.jpg") for i in range(12)]
+        )
+        cls.post = cls.posts[0]
+        cls.comments = PostComment.objects.bulk_create(
+            [PostComment(author=author, post=cls.post, comment=f"comment {i}") for i in range(12)]
+        )
+        PostLike.objects.bulk_create([PostLike(author=cls.viewer, post=post) for post in cls.posts[::2]])
+        CommentLike.objects.bulk_create([CommentLike(author=cls.viewer, comment=comment) for comment in cls.comments[::2]])
+
+    def setUp(self):
+        clear_representation_caches()
+        self.client.force_authenticate(self.viewer)
+
+    def assertConstantQueries(self, url, queries):
+        for page_size in (2, 10):
+            clear_representation_caches()
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['result']), page_size)
+        return response.data['result']
+
+    def test_post_list(self):
+        result = self.assertConstantQueries('/api/posts/', 1)
+        liked = {str(post.id) for post in self.posts[::2]}
+        self.assertEqual({data['id'] for data in result if data['me_liked']}, {data['id'] for data in result} & liked)
+
+    def test_post_comment_list(self):
+        result = self.assertConstantQueries(f'/api/posts/{self.post.id}/comments/', 3)
+        liked = {str(comment.id) for comment in self.comments[::2]}
+        self.assertEqual({data['id'] for data in result if data['me_liked']}, {data['id'] for data in result} & liked)
+
+    def test_comment_list(self):
+        result = self.assertConstantQueries('/api/post/comments/', 5)
+        liked = {str(comment.id) for comment in self.comments[::2]}
+        self.assertEqual({data['id'] for data in result if data['me_liked']}, {data['id'] for data in result} & liked)
+
+
+class KeysetCursorTests(APITestCase):
+    # A tampered cursor is a 404, not a server error
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+
+    def test_invalid_cursors(self):
+        cursors = [
+            'not-base64!',
+            KeysetPagination.encode_cursor((datetime.now(), 'not-a-uuid')),
+            KeysetPagination.encode_cursor((datetime.now(), 123)),
+            base64.urlsafe_b64encode(json.dumps({"c": "2024-01-01T00:00:00", "i": 123}).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps(["c", "i"]).encode()).decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor):
+                self.assertEqual(self.client.get('/api/posts/', {'cursor': cursor}).status_code, 404)
+
+
+class AuthorQueryCountTests(APITestCase):
+    # Authors come with the rows they wrote (AuthorQuerySet.with_author), without their password hash
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        authors = [User.objects.create(username=f"author_{i}", auth_status=DONE) for i in range(12)]
+        cls.posts = Post.objects.bulk_create(
+            [Post(author=author, caption="post", image="post-images/test.jpg") for author in authors]
+        )
+        cls.post = cls.posts[0]
+        cls.comments = PostComment.objects.bulk_create(
+            [PostComment(author=author, post=cls.post, comment="comment") for author in authors]
+        )
+        cls.comment = cls.comments[0]
+        PostLike.objects.bulk_create([PostLike(author=author, post=cls.post) for author in authors])
+        CommentLike.objects.bulk_create([CommentLike(author=author, comment=cls.comment) for author in authors])
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+
+    def assertAuthorsLoaded(self, url, queries):
+        for page_size in (2, 10):
+            clear_representation_caches()
+            with self.assertNumQueries(queries) as captured:
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            result = response.data['result']
+            self.assertEqual(len({data['author']['username'] for data in result}), page_size)
+            for query in captured.captured_queries:
+                self.assertNotIn('"users_user"."password"', query['sql'])
+
+    def test_post_list(self):
+        self.assertAuthorsLoaded('/api/posts/', 1)
+
+    def test_post_comment_list(self):
+        self.assertAuthorsLoaded(f'/api/posts/{self.post.id}/comments/', 3)
+
+    def test_post_like_list(self):
+        self.assertAuthorsLoaded(f'/api/post/{self.post.id}/likes/', 1)
+
+    def test_comment_like_list(self):
+        self.assertAuthorsLoaded(f'/api/post/comments/{self.comment.id}/likes/', 1)
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=2)
+class FeedTests(APITestCase):
+    # The feed merges the fanned out timeline with the posts of the viewer and of high-follower authors
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        friend = User.objects.create(username="friend", auth_status=DONE)
+        celebrity = User.objects.create(username="celebrity", auth_status=DONE)
+        stranger = User.objects.create(username="stranger", auth_status=DONE)
+        cls.viewer.follow(friend)
+        cls.viewer.follow(celebrity)
+        stranger.follow(celebrity)
+
+        authors = [friend, celebrity, cls.viewer, stranger]
+        posts = [Post.objects.create(author=authors[i % 4], caption=f"post {i}", image="post-images/test.jpg")
+                 for i in range(16)]
+        for post in posts:
+            fan_out_post_task(post.id)
+        cls.expected = [str(post.id) for post in reversed(posts) if post.author_id != stranger.id]
+
+    def setUp(self):
+        clear_representation_caches()
+        self.client.force_authenticate(self.viewer)
+
+    def test_pages_follow_the_timeline(self):
+        self.assertEqual(FeedEntry.objects.filter(user=self.viewer).count(), 4)
+        seen, pages, url = [], [], '/api/posts/feed/'
+        while url:
+            response = self.client.get(url, {'page_size': 5} if url.endswith('/') else None)
+            self.assertEqual(response.status_code, 200)
+            pages.append([data['id'] for data in response.data['result']])
+            seen += pages[-1]
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([data['id'] for data in response.data['result']], pages[-2])
+
+    def test_count(self):
+        response = self.client.get('/api/posts/feed/', {'count': 'true'})
+        self.assertEqual(response.data['count'], len(self.expected))
+
+
+class CommentCountTests(APITestCase):
+    # comments_count follows comment creation and deletion, cascades included
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        cls.post = Post.objects.create(author=cls.viewer, caption="post", image="post-images/test.jpg")
+
+    def setUp(self):
+        clear_representation_caches()
+        self.client.force_authenticate(self.viewer)
+
+    def comments_count(self):
+        return Post.objects.values_list('comments_count', flat=True).get(id=self.post.id)
+
+    def test_create_and_delete(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/comments/create/', {'post': self.post.id, 'comment': 'top'})
+        self.assertEqual(response.status_code, 201, response.data)
+        top = PostComment.objects.get(id=response.data['id'])
+        response = self.client.post('/api/post/comments/', {'post': self.post.id, 'parent': top.id, 'comment': 'reply'})
+        self.assertEqual(response.status_code, 201, response.data)
+        PostComment.objects.create(author=self.viewer, post=self.post, comment='other')
+        Post.change_comments_count(self.post.id, 1)
+        self.assertEqual(self.comments_count(), 3)
+
+        # The reply goes with its parent
+        top.delete()
+        self.assertEqual(self.comments_count(), 1)
+        PostComment.objects.all().delete()
+        self.assertEqual(self.comments_count(), 0)
+
+    def test_drifted_counter_stays_at_zero(self):
+        comment = PostComment.objects.create(author=self.viewer, post=self.post, comment='uncounted')
+        comment.delete()
+        self.assertEqual(self.comments_count(), 0)
+
+    def test_post_delete_skips_its_counter(self):
+        PostComment.objects.bulk_create([PostComment(author=self.viewer, post=self.post, comment='c') for _ in range(3)])
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "posts"')])
+
+
+class CommentThreadTests(APITestCase):
+    # Replies are loaded a level at a time and capped in depth and per parent
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        cls.post = Post.objects.create(author=cls.viewer, caption="post", image="post-images/test.jpg")
+        cls.top = PostComment.objects.bulk_create(
+            [PostComment(author=cls.viewer, post=cls.post, comment=f"top {i}") for i in range(6)]
+        )
+        parents = cls.top
+        for depth in range(4):
+            parents = PostComment.objects.bulk_create([
+                PostComment(author=cls.viewer, post=cls.post, parent=parent, comment=f"reply {depth} {i}")
+                for parent in parents for i in range(2 if depth else 5)
+            ])
+
+    def setUp(self):
+        clear_representation_caches()
+        self.client.force_authenticate(self.viewer)
+
+    def get_thread(self, page_size):
+        response = self.client.get(f'/api/posts/{self.post.id}/comments/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['result']), page_size)
+        return response.data['result']
+
+    def test_thread_queries_per_level(self):
+        # The page, its comments, three levels of replies and the counts below the last one
+        for page_size in (2, 6):
+            clear_representation_caches()
+            with self.assertNumQueries(6):
+                self.get_thread(page_size)
+
+    def test_thread_defaults(self):
+        comment = self.get_thread(1)[0]
+        self.assertEqual((len(comment['replies']), comment['replies_count']), (5, 5))
+        for depth in range(1, 4):
+            comment = comment['replies'][0]
+            self.assertEqual(comment['replies_count'], 2)
+            self.assertEqual(len(comment['replies'] or []), 2 if depth < 3 else 0)
+        self.assertIsNone(comment['replies'])
+        self.assertIsNotNone(comment['replies_next'])
+
+    @override_settings(COMMENT_THREAD_MAX_DEPTH=2, COMMENT_THREAD_REPLIES_PER_LEVEL=3)
+    def test_caps_truncate(self):
+        with self.assertNumQueries(5):
+            comment = self.get_thread(1)[0]
+        top = PostComment.objects.get(id=comment['id'])
+        self.assertEqual(comment['replies_count'], 5)
+        self.assertEqual(len(comment['replies']), 3)
+        self.assertLessEqual(
+            {reply['id'] for reply in comment['replies']}, {str(reply.id) for reply in top.child.all()}
+        )
+        cursor = re.search(r'cursor=([^&]+)&page_size=3', comment['replies_next'])
+        self.assertIsNotNone(cursor)
+
+        # The next page of replies picks up after the shown ones
+        response = self.client.get(comment['replies_next'])
+        self.assertEqual(response.status_code, 200)
+        next_ids = {reply['id'] for reply in response.data['result']}
+        self.assertEqual(len(next_ids), 2)
+        self.assertFalse(next_ids & {reply['id'] for reply in comment['replies']})
+
+        reply = comment['replies'][0]
+        self.assertEqual((len(reply['replies']), reply['replies_count']), (2, 2))
+        self.assertIsNone(reply['replies_next'])
+
+        # Replies at the maximum depth are counted, not shown
+        nested = reply['replies'][0]
+        self.assertIsNone(nested['replies'])
+        self.assertEqual(nested['replies_count'], 2)
+        self.assertTrue(nested['replies_next'].endswith(f"/api/post/comments/{nested['id']}/replies/"))
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    # Views on ClaimsJWTAuthentication only read the claim fields of request.user, and refuse the
+    # access tokens of a blacklisted refresh token
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        cls.post = Post.objects.create(author=cls.viewer, caption="post", image="post-images/test.jpg")
+        cls.comment = PostComment.objects.create(author=cls.viewer, post=cls.post, comment="comment")
+        PostComment.objects.create(author=cls.viewer, post=cls.post, parent=cls.comment, comment="reply")
+        PostLike.objects.create(author=cls.viewer, post=cls.post)
+        CommentLike.objects.create(author=cls.viewer, comment=cls.comment)
+
+    def setUp(self):
+        clear_representation_caches()
+        auth_states.clear()
+        blacklisted_tokens.clear()
+        self.addCleanup(blacklisted_tokens.clear)
+        self.tokens = issue_tokens(self.viewer, 'login')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def test_views_read_claim_fields_only(self):
+        urls = [
+            '/api/posts/',
+            '/api/posts/feed/',
+            f'/api/posts/{self.post.id}/',
+            f'/api/posts/{self.post.id}/comments/',
+            f'/api/post/comments/{self.comment.id}/',
+            f'/api/post/comments/{self.comment.id}/replies/',
+            f'/api/post/{self.post.id}/likes/',
+            f'/api/post/comments/{self.comment.id}/likes/',
+        ]
+        # Reading a deferred field of the claims user loads the row
+        with mock.patch.object(User, 'refresh_from_db', side_effect=AssertionError("user row loaded")):
+            for url in urls:
+                with self.subTest(url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_blacklisted_refresh_token_revokes_access(self):
+        self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+        UserRefreshToken(self.tokens['refresh_token']).blacklist()
+        self.assertEqual(self.client.get('/api/posts/').status_code, 401)
+
+    def test_async_views_refuse_blacklisted_token(self):
+        # The views served when ASYNC_VIEWS is on
+        view = async_views.PostListApiView.as_view()
+        request = lambda: RequestFactory().get('/api/posts/', HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        with mock.patch.object(User, 'refresh_from_db', side_effect=AssertionError("user row loaded")):
+            self.assertEqual(async_to_sync(view)(request()).status_code, 200)
+        UserRefreshToken(self.tokens['refresh_token']).blacklist()
+        self.assertEqual(async_to_sync(view)(request()).status_code, 401)
+
+
+class LikeEndpointTests(APITestCase):
+    # PUT likes and DELETE unlikes are idempotent; likes_count moves only with the like row
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username="viewer", auth_status=DONE)
+        cls.post = Post.objects.create(author=cls.viewer, caption="post", image="post-images/test.jpg")
+        cls.comment = PostComment.objects.create(author=cls.viewer, post=cls.post, comment="comment")
+
+    def setUp(self):
+        clear_representation_caches()
+        self.client.force_authenticate(self.viewer)
+        self.targets = [
+            (f'/api/post/{self.post.id}/like/', Post, self.post.id),
+            (f'/api/post/comments/{self.comment.id}/like/', PostComment, self.comment.id),
+        ]
+
+    def likes_count(self, model, pk):
+        return model.objects.values_list('likes_count', flat=True).get(id=pk)
+
+    def test_like_twice(self):
+        for url, model, pk in self.targets:
+            with self.subTest(url):
+                for changed in (True, False):
+                    response = self.client.put(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.data['data']['likes_count'], 1)
+                    self.assertEqual(response.data['message'].endswith("added."), changed)
+                self.assertEqual(self.likes_count(model, pk), 1)
+
+    def test_unlike_when_not_liked(self):
+        for url, model, pk in self.targets:
+            with self.subTest(url):
+                response = self.client.delete(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['data']['likes_count'], 0)
+                self.assertEqual(self.likes_count(model, pk), 0)
+
+    def test_counter_never_goes_negative(self):
+        for url, model, pk in self.targets:
+            with self.subTest(url):
+                self.client.put(url)
+                # Drifted below the real count
+                model.objects.filter(id=pk).update(likes_count=0)
+                self.assertEqual(self.client.delete(url).data['data']['likes_count'], 0)
+                self.client.delete(url)
+                self.assertEqual(self.likes_count(model, pk), 0)
+
+    def test_missing_target(self):
+        self.assertEqual(self.client.put(f'/api/post/{self.viewer.id}/like/').status_code, 404)
+
+    @skipUnless(connection.vendor == 'postgresql', "The single statement path needs PostgreSQL")
+    def test_one_statement(self):
+        for url, _, _ in self.targets:
+            for method in (self.client.put, self.client.put, self.client.delete, self.client.delete):
+                with self.subTest(url, method=method.__name__), self.assertNumQueries(1):
+                    self.assertEqual(method(url).status_code, 200)
+
+
+@override_settings(LIKE_BUFFER_ENABLED=True, LIKE_BUFFER_BACKEND='post.like_buffer.LocalLikeBuffer')
+class LikeBufferFlushTests(TestCase):
+    # likes_count moves by the like rows that the flush really inserted or deleted
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f"liker_{i}", auth_status=DONE) for i in range(3)]
+        cls.post = Post.objects.create(author=cls.users[0], caption="post", image="post-images/test.jpg")
+
+    def setUp(self):
+        clear_representation_caches()
+        self.buffer = get_like_buffer()
+
+    def test_flush_counts_changed_rows_only(self):
+        liked, raced, unliked = self.users
+        # Already liked by a request that bypassed the buffer, and an unlike of a like that is gone
+        PostLike.objects.create(author=raced, post=self.post)
+        for user, value in ((liked, True), (raced, True), (unliked, False)):
+            self.buffer.set(POST, str(self.post.id), user.id, value)
+
+        self.assertEqual(flush_likes(POST), 3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(PostLike.objects.filter(post=self.post).count(), 2)
+
+
+# Plan nodes of a full table scan or of a sort
+BAD_PLAN = re.compile(r'Seq Scan|(^|->\s*)(Incremental )?Sort\b', re.MULTILINE)
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN checks need PostgreSQL")
+class HotQueryPlanTests(TestCase):
+    # Every hot query shape is served by an index: no sequential scan and no sort in its plan
+    rows = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(username=f"explain_{i}", auth_status=DONE) for i in range(cls.rows // 100)]
+        )
+        cls.viewer = users[0]
+        posts = Post.objects.bulk_create(
+            [Post(author=users[i % len(users)], caption="explain", image="post-images/explain.jpg")
+             for i in range(cls.rows)]
+        )
+        cls.post = posts[-1]
+        comments = PostComment.objects.bulk_create(
+            [PostComment(author=users[i % len(users)], post=posts[i % len(posts)], comment="explain")
+             for i in range(cls.rows)]
+        )
+        cls.comment = comments[-1]
+        PostComment.objects.bulk_create(
+            [PostComment(author=user, post=cls.comment.post, parent=cls.comment, comment="reply") for user in users]
+        )
+        PostLike.objects.bulk_create([PostLike(author=user, post=cls.post) for user in users])
+        CommentLike.objects.bulk_create([CommentLike(author=user, comment=cls.comment) for user in users])
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user=user, post=post, post_created_at=post.created_at) for post in posts for user in users[:5]]
+        )
+        UserConfirmation.objects.bulk_create(
+            [UserConfirmation(user=users[i % len(users)], code='1234', verify_type=VIA_EMAIL,
+                              expiration_time=datetime.now(), is_confirmed=i % 3 == 0) for i in range(cls.rows)]
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE posts, post_comments, post_likes, comment_likes, feed_entries, users_userconfirmation")
+            # A seq scan or sort left in the plan then means that no index can serve the query
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+
+    def view_queryset(self, view_class, **kwargs):
+        # The view's own queryset, ordered and sliced the way KeysetPagination pages it
+        view = view_class(request=SimpleNamespace(user=self.viewer), kwargs=kwargs)
+        ordering = getattr(view, 'ordering', KeysetPagination.ordering)
+        return view.get_queryset().order_by(*ordering)[:KeysetPagination.page_size + 1]
+
+    def test_hot_queries_use_indexes(self):
+        thread = CommentThread(self.viewer)
+        entries, own_posts = timeline_queries(self.viewer, KeysetPagination.page_size + 1)
+        shapes = {
+            'PostListApiView': self.view_queryset(PostListApiView),
+            'FeedApiView.timeline': entries,
+            'FeedApiView.timeline own posts': own_posts,
+            'PostCommentListApiView': self.view_queryset(PostCommentListApiView, pk=self.post.id),
+            'CommentRepliesListApiView': self.view_queryset(CommentRepliesListApiView, pk=self.comment.id),
+            'PostLikeListApiView': self.view_queryset(PostLikeListApiView, pk=self.post.id),
+            'CommentLikeListView': self.view_queryset(CommentLikeListView, pk=self.comment.id),
+            'CommentThread.load': thread.replies_queryset([self.comment.id]),
+            'VerifyApiView.check_verify': self.viewer.verify_codes.filter(
+                expiration_time__gte=datetime.now(), code='1234', is_confirmed=False
+            ),
+        }
+        for name, queryset in shapes.items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(BAD_PLAN.search(plan), plan)
+
+    def test_feed_reads_timeline(self):
+        # Served by feed_user_created_idx, without touching the posts table
+        entries = timeline_queries(self.viewer, KeysetPagination.page_size + 1)[0]
+        plan = entries.explain()
+        self.assertIn('feed_user_created_idx', plan)
+        self.assertNotIn('posts', plan)
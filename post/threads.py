@@ -0,0 +1,70 @@
+from collections import defaultdict
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from .models import PostComment
+
+
+# Replies of a page of comments: one query for the page, then one per level for at most
+# COMMENT_THREAD_REPLIES_PER_LEVEL replies of each parent, down to COMMENT_THREAD_MAX_DEPTH.
+# A large thread costs the rows that are shown, never the whole post
+class CommentThread:
+    def __init__(self, user):
+        self.user = user
+        # Comments whose replies have been fetched
+        self.loaded = set()
+        self.nodes = {}
+        self.children = defaultdict(list)
+        self.counts = {}
+
+    def comments(self):
+        return PostComment.objects.with_viewer_state(self.user)
+
+    def load(self, comments):
+        ids = [comment.id for comment in comments if comment.id not in self.loaded]
+        if not ids:
+            return self
+
+        for comment in self.comments().filter(id__in=ids):
+            self.nodes[comment.id] = comment
+
+        for depth in range(settings.COMMENT_THREAD_MAX_DEPTH):
+            self.loaded.update(ids)
+            replies = self.replies_queryset(ids)
+
+            ids = []
+            # Ordered here rather than by the query, which then needs no sort besides the index's
+            for reply in sorted(replies, key=attrgetter('position')):
+                self.nodes[reply.id] = reply
+                self.children[reply.parent_id].append(reply)
+                self.counts[reply.parent_id] = reply.siblings
+                ids.append(reply.id)
+            if not ids:
+                return self
+
+        # Replies below the last level are not shown, only counted
+        self.counts.update(
+            PostComment.objects.filter(parent_id__in=ids).order_by()
+            .values('parent_id').annotate(replies=Count('id')).values_list('parent_id', 'replies')
+        )
+        self.loaded.update(ids)
+        return self
+
+    def replies_queryset(self, parent_ids):
+        return self.comments().filter(parent_id__in=parent_ids).annotate(
+            position=Window(RowNumber(), partition_by=F('parent_id'), order_by=(F('created_at'), F('id'))),
+            siblings=Window(Count('id'), partition_by=F('parent_id')),
+        ).filter(position__lte=settings.COMMENT_THREAD_REPLIES_PER_LEVEL)
+
+    def get(self, comment):
+        self.load([comment])
+        return self.nodes.get(comment.id, comment)
+
+    def replies(self, comment_id):
+        return self.children.get(comment_id, [])
+
+    def replies_count(self, comment_id):
+        return self.counts.get(comment_id, 0)
@@ -1,18 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from .views import PostListApiView, PostCreateApiView, PostEditApiView, PostCommentListApiView,\
-                    PostCommentCreateApiView, CommentListCreateApiView, PostLikeListApiView, CommentDetailApiView, \
-                    CommentLikeListView,  CommentLikeApiView, PostLikeApiView
+from . import async_views, views
+from .views import PostCreateApiView, PostEditApiView, PostCommentCreateApiView, CommentListCreateApiView, \
+                    CommentLikeApiView, PostLikeApiView
+
+# ASGI deployments (config/asgi.py) serve the read-only endpoints with the async views
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('posts/', PostListApiView.as_view(), name="posts_list"),
+    path('posts/', read_views.PostListApiView.as_view(), name="posts_list"),
+    path('posts/feed/', read_views.FeedApiView.as_view(), name="posts_feed"),
     path('post/create/', PostCreateApiView.as_view(), name="post_create"),
+    path('posts/<uuid:pk>/', read_views.PostDetailApiView.as_view(), name="post_detail"),
     path('posts/<uuid:pk>/edit/', PostEditApiView.as_view(), name="post_edit"),
-    path('posts/<uuid:pk>/comments/', PostCommentListApiView.as_view(), name="post_comments"),
+    path('posts/<uuid:pk>/comments/', read_views.PostCommentListApiView.as_view(), name="post_comments"),
     path('posts/<uuid:pk>/comments/create/', PostCommentCreateApiView.as_view(), name="post_comments_create"),
     path('post/comments/', CommentListCreateApiView.as_view(), name="comments_create"),
-    path('post/comments/<uuid:pk>/', CommentDetailApiView.as_view(), name="post_comment_detail"),
-    path('post/<uuid:pk>/likes/', PostLikeListApiView.as_view(), name="post_likes_list"),
-    path('post/comments/<uuid:pk>/likes/', CommentLikeListView.as_view(), name="post_comment_likes"),
+    path('post/comments/<uuid:pk>/', read_views.CommentDetailApiView.as_view(), name="post_comment_detail"),
+    path('post/comments/<uuid:pk>/replies/', read_views.CommentRepliesListApiView.as_view(), name="comment_replies"),
+    path('post/<uuid:pk>/likes/', read_views.PostLikeListApiView.as_view(), name="post_likes_list"),
+    path('post/comments/<uuid:pk>/likes/', read_views.CommentLikeListView.as_view(), name="post_comment_likes"),
     path('post/<uuid:pk>/like/', PostLikeApiView.as_view(), name="post_like"),
     path('post/comments/<uuid:pk>/like/', CommentLikeApiView.as_view(), name="comment_like"),
-]
\ No newline at end of file
+]
@@ -2,20 +2,30 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
+from django.db import transaction
 from rest_framework.generics import (
     ListAPIView, CreateAPIView, RetrieveUpdateDestroyAPIView,
     ListCreateAPIView, RetrieveAPIView
 )
-from shared.custom_pagination import CustomPagination
+from shared.custom_pagination import CustomPagination, KeysetPagination
+from users.authentication import ClaimsJWTAuthentication
+from .like_buffer import POST, COMMENT, get_like_buffer, drop_buffered_like
+from .feed import FeedPagination
+from .likes import like, unlike
 from .models import Post, PostLike, PostComment, CommentLike
 from .serializers import PostSerializer, PostLikeSerializer, CommentSerializer, CommentLikeSerializers
+from .signals import invalidate, comment_and_ancestors
+from .tasks import fan_out_post_task, process_post_image_task
 
 
 class PostListApiView(ListAPIView):
-    queryset = Post.objects.all()
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = PostSerializer
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
 
 
 class PostCreateApiView(CreateAPIView):
@@ -23,35 +33,65 @@ class PostCreateApiView(CreateAPIView):
     serializer_class = PostSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        transaction.on_commit(lambda: process_post_image_task.delay(post.id))
+        transaction.on_commit(lambda: fan_out_post_task.delay(post.id))
+
+
+class FeedApiView(ListAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = PostSerializer
+    pagination_class = FeedPagination
+
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
+
+
+class PostDetailApiView(RetrieveAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = PostSerializer
+
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
 
 
 class PostEditApiView(RetrieveUpdateDestroyAPIView):
-    queryset = Post.objects.all()
     permission_classes = [IsAuthenticated]
     serializer_class = PostSerializer
 
+    def get_queryset(self):
+        return Post.objects.with_viewer_state(self.request.user)
+
     def put(self, request, *args, **kwargs):
         post = self.get_object()
+        previous_image = post.image.name
         serializer = self.serializer_class(post, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        if 'image' in serializer.validated_data:
+            # Releases the blob reference; the file itself goes with its last reference
+            post.image.storage.delete(previous_image)
+            transaction.on_commit(lambda: process_post_image_task.delay(post.id))
         return Response({"success": True, "message": "Post successfully updated", "data": serializer.data})
 
     def delete(self, request, *args, **kwargs):
         post = self.get_object()
+        # The image and its renditions are released by post/signals.py
         post.delete()
         return Response({"success": True, "message": "Post successfully deleted"})
 
 
 class PostCommentListApiView(ListAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = CommentSerializer
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         post_id = self.kwargs.get("pk")
-        return PostComment.objects.filter(post_id=post_id).order_by('-created_at')
+        return PostComment.objects.filter(post_id=post_id, parent__isnull=True)
 
 
 class PostCommentCreateApiView(CreateAPIView):
@@ -61,7 +101,9 @@ class PostCommentCreateApiView(CreateAPIView):
 
     def perform_create(self, serializer):
         post_id = self.kwargs.get('pk')
-        serializer.save(author=self.request.user, post_id=post_id)
+        with transaction.atomic():
+            serializer.save(author=self.request.user, post_id=post_id)
+            Post.change_comments_count(post_id, 1)
 
 
 class CommentListCreateApiView(ListCreateAPIView):
@@ -71,48 +113,87 @@ class CommentListCreateApiView(ListCreateAPIView):
     pagination_class = CustomPagination
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            comment = serializer.save(author=self.request.user)
+            Post.change_comments_count(comment.post_id, 1)
 
 
 class CommentDetailApiView(RetrieveAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [AllowAny]
     queryset = PostComment.objects.all()
     serializer_class = CommentSerializer
 
 
+class CommentRepliesListApiView(ListAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
+    ordering = ('created_at', 'id')
+
+    def get_queryset(self):
+        comment_id = self.kwargs.get('pk')
+        return PostComment.objects.filter(parent_id=comment_id)
+
+
 class PostLikeListApiView(ListAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [AllowAny]
     serializer_class = PostLikeSerializer
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         post_id = self.kwargs.get('pk')
-        return PostLike.objects.filter(post_id=post_id).order_by('-created_at')
+        return PostLike.objects.filter(post_id=post_id)
 
 
 class CommentLikeListView(ListAPIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [AllowAny]
     serializer_class = CommentLikeSerializers
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         comment_id = self.kwargs.get('pk')
-        return CommentLike.objects.filter(comment_id=comment_id).order_by('-created_at')
+        return CommentLike.objects.filter(comment_id=comment_id)
+
+
+def toggle_buffered_like(buffer, kind, queryset, pk, user):
+    # The viewer's current state comes from the buffer, or from one query that also checks the target exists.
+    # Returns the new state, or None when the target does not exist
+    liked = buffer.get_many(kind, user.id, [str(pk)]).get(str(pk))
+    if liked is None:
+        liked = queryset.filter(id=pk).with_viewer_state(user).values_list('viewer_liked', flat=True).first()
+        if liked is None:
+            return None
+    buffer.set(kind, str(pk), user.id, not liked)
+    return not liked
 
 
 class PostLikeApiView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
+        buffer = get_like_buffer()
+        if buffer is not None:
+            return self.buffered_post(buffer, request, pk)
+
         post = Post.objects.filter(id=pk).first()
         if not post:
             return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        post_like, created = PostLike.objects.get_or_create(
-            author=request.user, post_id=pk
-        )
+        with transaction.atomic():
+            post_like, created = PostLike.objects.get_or_create(
+                author=request.user, post_id=pk
+            )
+            if not created:
+                deleted, _ = PostLike.objects.filter(id=post_like.id).delete()
+                Post.change_likes_count(pk, -deleted)
+            else:
+                Post.change_likes_count(pk, 1)
+
         if not created:
-            post_like.delete()
             return Response({"success": True, "message": "Post like successfully removed."},
                             status=status.HTTP_204_NO_CONTENT)
 
@@ -120,23 +201,95 @@ class PostLikeApiView(APIView):
         return Response({"success": True, "message": "Post like successfully added.", "data": serializer.data},
                         status=status.HTTP_201_CREATED)
 
+    def buffered_post(self, buffer, request, pk):
+        liked = toggle_buffered_like(buffer, POST, Post.objects, pk, request.user)
+        if liked is None:
+            return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Written to post_likes by flush_like_buffer_task
+        message = "Post like successfully added." if liked else "Post like successfully removed."
+        return Response({"success": True, "message": message, "data": {"post": pk, "me_liked": liked}},
+                        status=status.HTTP_202_ACCEPTED)
+
+    # PUT likes and DELETE unlikes: idempotent, so clients can retry them
+    def put(self, request, pk):
+        return self.respond(request, pk, like(PostLike, pk, request.user), liked=True)
+
+    def delete(self, request, pk):
+        return self.respond(request, pk, unlike(PostLike, pk, request.user), liked=False)
+
+    def respond(self, request, pk, result, liked):
+        if result is None:
+            return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        likes_count, changed, _ = result
+        drop_buffered_like(POST, pk, request.user)
+        if changed:
+            invalidate(PostSerializer, pk)
+            message = "Post like successfully added." if liked else "Post like successfully removed."
+        else:
+            message = "Post is already liked." if liked else "Post is not liked."
+        return Response({"success": True, "message": message,
+                         "data": {"post": pk, "me_liked": liked, "likes_count": likes_count}})
+
 
 class CommentLikeApiView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
+        buffer = get_like_buffer()
+        if buffer is not None:
+            return self.buffered_post(buffer, request, pk)
+
         comment = PostComment.objects.filter(id=pk).first()
         if not comment:
             return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        comment_like, created = CommentLike.objects.get_or_create(
-            author=request.user, comment_id=pk
-        )
+        with transaction.atomic():
+            comment_like, created = CommentLike.objects.get_or_create(
+                author=request.user, comment_id=pk
+            )
+            if not created:
+                deleted, _ = CommentLike.objects.filter(id=comment_like.id).delete()
+                PostComment.change_likes_count(pk, -deleted)
+            else:
+                PostComment.change_likes_count(pk, 1)
+
         if not created:
-            comment_like.delete()
             return Response({"success": True, "message": "Comment like successfully removed."},
                             status=status.HTTP_204_NO_CONTENT)
 
         serializer = CommentLikeSerializers(comment_like)
         return Response({"success": True, "message": "Comment like successfully added.", "data": serializer.data},
                         status=status.HTTP_201_CREATED)
+
+    def buffered_post(self, buffer, request, pk):
+        liked = toggle_buffered_like(buffer, COMMENT, PostComment.objects, pk, request.user)
+        if liked is None:
+            return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Written to comment_likes by flush_like_buffer_task
+        message = "Comment like successfully added." if liked else "Comment like successfully removed."
+        return Response({"success": True, "message": message, "data": {"comment": pk, "me_liked": liked}},
+                        status=status.HTTP_202_ACCEPTED)
+
+    # PUT likes and DELETE unlikes: idempotent, so clients can retry them
+    def put(self, request, pk):
+        return self.respond(request, pk, like(CommentLike, pk, request.user), liked=True)
+
+    def delete(self, request, pk):
+        return self.respond(request, pk, unlike(CommentLike, pk, request.user), liked=False)
+
+    def respond(self, request, pk, result, liked):
+        if result is None:
+            return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        likes_count, changed, (parent_id,) = result
+        drop_buffered_like(COMMENT, pk, request.user)
+        if changed:
+            invalidate(CommentSerializer, *comment_and_ancestors(pk, parent_id))
+            message = "Comment like successfully added." if liked else "Comment like successfully removed."
+        else:
+            message = "Comment is already liked." if liked else "Comment is not liked."
+        return Response({"success": True, "message": message,
+                         "data": {"comment": pk, "me_liked": liked, "likes_count": likes_count}})
@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import UploadSession, MediaBlob
 
-# Register your models here.
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'target', 'filename', 'received_size', 'total_size', 'status', 'created_at')
+    search_fields = ('id', 'user__username', 'filename')
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'size', 'ref_count', 'created_at')
+    search_fields = ('id', 'name')
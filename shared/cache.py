@@ -0,0 +1,239 @@
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+
+from .metrics import REPRESENTATION_CACHE_LOOKUPS
+
+
+class RepresentationCache:
+    # Serialized objects shared by every viewer, stored under a per-object version token.
+    # invalidate() drops the token: a representation built from a read that raced with a write
+    # is stored under the old token and never served.
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    @property
+    def cache(self):
+        return caches[settings.REPRESENTATION_CACHE_ALIAS]
+
+    def version_key(self, object_id):
+        return f"rep:{self.kind}:{object_id}"
+
+    def data_key(self, object_id, token, variant):
+        return f"rep:{self.kind}:{object_id}:{token}:{variant}"
+
+    def get_tokens(self, ids):
+        keys = {self.version_key(object_id): object_id for object_id in ids}
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            # Reserved before the caller reads the database; add() keeps a token reserved concurrently
+            for key in missing:
+                self.cache.add(key, uuid.uuid4().hex, settings.REPRESENTATION_CACHE_TIMEOUT)
+            found.update(self.cache.get_many(missing))
+        return {keys[key]: token for key, token in found.items()}
+
+    def get_many(self, ids, variant):
+        # ({id: representation} for hits, {id: token} to store the misses with)
+        tokens = self.get_tokens(ids)
+        keys = {self.data_key(object_id, token, variant): object_id for object_id, token in tokens.items()}
+        hits = {keys[key]: data for key, data in self.cache.get_many(keys).items()}
+
+        REPRESENTATION_CACHE_LOOKUPS.labels(self.kind, 'hit').inc(len(hits))
+        REPRESENTATION_CACHE_LOOKUPS.labels(self.kind, 'miss').inc(len(ids) - len(hits))
+        return hits, tokens
+
+    def set(self, object_id, token, variant, data):
+        self.cache.set(self.data_key(object_id, token, variant), data, settings.REPRESENTATION_CACHE_TIMEOUT)
+
+    def invalidate(self, ids):
+        self.cache.delete_many([self.version_key(object_id) for object_id in ids])
+
+
+class VersionedRepresentationCache:
+    # Representations keyed by object id and version: a new version is a new key, nothing is invalidated.
+    # An in-process LRU sits in front of the shared cache.
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.REPRESENTATION_CACHE_ALIAS]
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                if key in self.local:
+                    self.local.move_to_end(key)
+                    found[key] = self.local[key]
+                else:
+                    missing.append(key)
+        REPRESENTATION_CACHE_LOOKUPS.labels(self.kind, 'local_hit').inc(len(found))
+
+        if missing:
+            shared = self.cache.get_many([f"memo:{key}" for key in missing])
+            for key in missing:
+                data = shared.get(f"memo:{key}")
+                if data is not None:
+                    found[key] = data
+                    self.remember(key, data)
+            REPRESENTATION_CACHE_LOOKUPS.labels(self.kind, 'hit').inc(len(shared))
+            REPRESENTATION_CACHE_LOOKUPS.labels(self.kind, 'miss').inc(len(missing) - len(shared))
+        return found
+
+    def set(self, key, data):
+        self.remember(key, data)
+        self.cache.set(f"memo:{key}", data, settings.REPRESENTATION_MEMO_TIMEOUT)
+
+    def remember(self, key, data):
+        with self.lock:
+            self.local[key] = data
+            self.local.move_to_end(key)
+            while len(self.local) > settings.REPRESENTATION_LRU_SIZE:
+                self.local.popitem(last=False)
+
+
+def request_variant(request):
+    # File fields render absolute URLs, so representations differ per scheme and host
+    if request is None:
+        return 'relative'
+    return hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()[:12]
+
+
+def prefetch_nested(serializer, instances):
+    # Batch lookup for the memoized serializers nested in a page, e.g. authors
+    for field in serializer.fields.values():
+        if isinstance(field, MemoizedRepresentationMixin):
+            field.prefetch([field.get_attribute(instance) for instance in instances])
+
+
+class CachedListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        # One cache round trip for the page and one for its nested objects
+        if isinstance(self.child, CachedRepresentationMixin):
+            self.child.prefetch_representations(items)
+        prefetch_nested(self.child, items)
+        return super(CachedListSerializer, self).to_representation(items)
+
+
+class MemoizedRepresentationMixin:
+    # Serializer mixin: representations are memoized per object and version_field,
+    # so saving the object changes the key and the old entry is never read again
+    memo = None
+    version_field = 'updated_at'
+
+    def memo_key(self, instance):
+        version = getattr(instance, self.version_field)
+        return f"{self.memo.kind}:{instance.pk}:{version.timestamp() if version else 0}:" \
+               f"{request_variant(self.context.get('request'))}"
+
+    def memoized(self):
+        return self.context.setdefault('memoized_representations', {})
+
+    def prefetch(self, instances):
+        memoized = self.memoized()
+        keys = {self.memo_key(instance) for instance in instances if instance is not None} - memoized.keys()
+        if keys:
+            found = self.memo.get_many(keys)
+            memoized.update({key: found.get(key) for key in keys})
+
+    def to_representation(self, instance):
+        key = self.memo_key(instance)
+        memoized = self.memoized()
+        if key not in memoized:
+            self.prefetch([instance])
+
+        data = memoized.get(key)
+        if data is None:
+            data = super(MemoizedRepresentationMixin, self).to_representation(instance)
+            memoized[key] = data
+            self.memo.set(key, data)
+        return data
+
+
+class CachedRepresentationMixin:
+    # ModelSerializer mixin: everything except uncached_fields is served from representation_cache.
+    # uncached_fields are computed on every request: the viewer's own state, and nested
+    # serializers that are memoized by version on their own
+    representation_cache = None
+    uncached_fields = ()
+
+    def cache_enabled(self):
+        # Responses to writes are always serialized from the saved instance
+        return not hasattr(self.root, 'initial_data')
+
+    def cached_representations(self):
+        return self.context.setdefault('cached_representations', {})
+
+    def representation_tokens(self):
+        return self.context.setdefault('representation_tokens', {})
+
+    def prefetch_representations(self, instances):
+        if not self.cache_enabled():
+            return
+        kind = self.representation_cache.kind
+        cached = self.cached_representations()
+        ids = [instance.pk for instance in instances if (kind, instance.pk) not in cached]
+        if not ids:
+            return
+        hits, tokens = self.representation_cache.get_many(ids, request_variant(self.context.get('request')))
+        for object_id in ids:
+            cached[(kind, object_id)] = hits.get(object_id)
+        self.representation_tokens().update({(kind, object_id): token for object_id, token in tokens.items()})
+        if hits:
+            self.load_viewer_state(list(hits.values()))
+
+    def is_cached(self, instance):
+        return self.cached_representations().get((self.representation_cache.kind, instance.pk)) is not None
+
+    def load_viewer_state(self, representations):
+        # Hook to fetch the viewer's state for a batch of cache hits at once
+        pass
+
+    def to_representation(self, instance):
+        if not self.cache_enabled():
+            return super(CachedRepresentationMixin, self).to_representation(instance)
+
+        key = (self.representation_cache.kind, instance.pk)
+        if key not in self.cached_representations():
+            self.prefetch_representations([instance])
+
+        shared = self.cached_representations()[key]
+        if shared is not None:
+            return self.apply_viewer_state(instance, shared)
+
+        data = super(CachedRepresentationMixin, self).to_representation(instance)
+        token = self.representation_tokens().get(key)
+        if token is not None:
+            self.representation_cache.set(instance.pk, token, request_variant(self.context.get('request')),
+                                          self.shared_representation(data))
+        return data
+
+    def shared_representation(self, data):
+        return {name: value for name, value in data.items() if name not in self.uncached_fields}
+
+    def apply_viewer_state(self, instance, shared):
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name not in self.uncached_fields:
+                ret[field.field_name] = shared.get(field.field_name)
+                continue
+            attribute = field.get_attribute(instance)
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            ret[field.field_name] = None if check_for_none is None else field.to_representation(attribute)
+        return ret
@@ -0,0 +1,84 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.module_loading import import_string
+
+
+def counted(queryset):
+    # Only what decides which rows there are: annotations that no filter uses (e.g. the viewer's
+    # with_viewer_state), joined authors and ordering are left out of the COUNT and of its cache key
+    return queryset.order_by().values('pk')
+
+
+class ExactCount:
+    def count(self, queryset):
+        return counted(queryset).count()
+
+
+class EstimatedCount:
+    # Planner statistics of postgres, only meaningful for a whole, unfiltered table
+    def count(self, queryset):
+        if not self.is_unfiltered(queryset):
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been vacuumed / analyzed
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
+
+    @staticmethod
+    def is_unfiltered(queryset):
+        query = queryset.query
+        return not query.where and not query.distinct and not query.combinator and query.low_mark == 0 \
+            and query.high_mark is None
+
+
+class CachedCount:
+    def __init__(self, timeout=None):
+        self.timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT if timeout is None else timeout
+
+    def count(self, queryset):
+        # The compiled SQL contains the filter values (e.g. post_id), so each filter gets its own entry;
+        # viewers of the same list share it
+        queryset = counted(queryset)
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.md5(f"{sql}|{params}".encode()).hexdigest()
+        key = f"pagination:count:{queryset.model._meta.label_lower}:{digest}"
+
+        total = cache.get(key)
+        if total is None:
+            total = queryset.count()
+            cache.set(key, total, self.timeout)
+        return total
+
+
+class AdaptiveCount:
+    # Exact below the threshold, planner estimate for whole tables, short lived cached count otherwise
+    def __init__(self, threshold=None, timeout=None):
+        self.threshold = settings.PAGINATION_EXACT_COUNT_THRESHOLD if threshold is None else threshold
+        self.estimated = EstimatedCount()
+        self.cached = CachedCount(timeout)
+
+    def count(self, queryset):
+        # COUNT over "LIMIT threshold + 1" stops scanning as soon as the threshold is exceeded
+        bounded = counted(queryset)[:self.threshold + 1].count()
+        if bounded <= self.threshold:
+            return bounded
+
+        estimate = self.estimated.count(queryset)
+        if estimate is not None and estimate > self.threshold:
+            return estimate
+        return self.cached.count(queryset)
+
+
+def get_count_strategy():
+    return import_string(settings.PAGINATION_COUNT_STRATEGY)()
@@ -1,17 +1,219 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from shared.count_strategy import get_count_strategy
+
+# Pages are sliced with one extra row to know whether a next page exists, so the total
+# count is only needed for the response body and can come from a cheaper count strategy
+class LazyCountPaginator(Paginator):
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return LazyCountPage(objects[:self.per_page], number, self, has_more=len(objects) > self.per_page)
+
+
+class LazyCountPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_more):
+        super(LazyCountPage, self).__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+
+class CountMixin:
+    count_query_param = "count"
 
-class CustomPagination(PageNumberPagination):
+    def get_count(self, queryset, request, default):
+        value = request.query_params.get(self.count_query_param)
+        enabled = default if value is None else value.lower() in ("1", "true", "yes")
+        return get_count_strategy().count(queryset) if enabled else None
+
+
+class CustomPagination(CountMixin, PageNumberPagination):
     page_size = 16
+    page_size_query_param = "page_size"
     page_size_query_description = "page_size"
     max_page_size = 128
+    django_paginator_class = LazyCountPaginator
+    # Numbered page controls of the browsable API would need an exact count
+    template = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request, default=True)
+        return super(CustomPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        payload = {
+            "next":self.get_next_link(),
+            "previous":self.get_previous_link(),
+        }
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["result"] = data
+        return Response(payload)
+
+
+def keyset_after(fields, position, descending):
+    # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+    lookup = 'lt' if descending else 'gt'
+    (first, second), (first_value, second_value) = fields, position
+    return Q(**{f"{first}__{lookup}": first_value}) | \
+        Q(**{first: first_value, f"{second}__{lookup}": second_value})
+
+
+# Cursor pagination keyed on (created_at, id): pages continue from the last seen key instead of
+# using OFFSET, and no COUNT(*) is run unless the client asks for it with ?count=true
+class KeysetPagination(CountMixin, BasePagination):
+    page_size = 16
+    page_size_query_param = "page_size"
+    max_page_size = 128
+    cursor_query_param = "cursor"
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request, default=False)
+        return self.paginate_results(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # The same page through the async ORM, for the async views
+        self.count = await sync_to_async(self.get_count)(queryset, request, default=False)
+        page = await self.apage_queryset(queryset, request, view)
+        return self.paginate_results([obj async for obj in page])
+
+    async def apage_queryset(self, queryset, request, view=None):
+        return self.page_queryset(queryset, request, view)
+
+    def page_queryset(self, queryset, request, view=None):
+        cursor = self.read_cursor(request, view)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor["position"], self.descending != self.reverse))
+        return queryset.order_by(*self.page_ordering())[:self.page_size + 1]
+
+    def read_cursor(self, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'ordering', None) or self.ordering
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.descending = self.ordering[0].startswith('-')
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = cursor is not None and cursor["reverse"]
+        return cursor
+
+    def page_ordering(self):
+        return self.ordering if not self.reverse else [self.invert(field) for field in self.ordering]
+
+    def paginate_results(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = self.has_cursor if not self.reverse else has_more
+        self.first = results[0] if results else None
+        self.last = results[-1] if results else None
+        return results
 
     def get_paginated_response(self, data):
-        return Response(
-            {
-                "next":self.get_next_link(),
-                "previous":self.get_previous_link(),
-                "count":self.page.paginator.count,
-                "result":data
-            }
-        )
\ No newline at end of file
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        payload = {
+            "next":self.get_next_link(),
+            "previous":self.get_previous_link(),
+        }
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["result"] = data
+        return payload
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['result'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'result': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.link(self.position(self.last), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.link(self.position(self.first), reverse=True)
+
+    def link(self, position, reverse):
+        url = remove_query_param(self.base_url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def position(self, obj):
+        return tuple(getattr(obj, field) for field in self.fields)
+
+    def after(self, position, descending):
+        return keyset_after(self.fields, position, descending)
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f"-{field}"
+
+    @staticmethod
+    def encode_cursor(position, reverse=False):
+        created_at, pk = position
+        payload = {"c": created_at.isoformat(), "i": str(pk), "r": reverse}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+            # Checked here: a malformed id would only fail in the query, as a server error
+            position = (datetime.fromisoformat(payload["c"]), uuid.UUID(payload["i"]))
+            return {"position": position, "reverse": bool(payload.get("r"))}
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound("Invalid cursor")
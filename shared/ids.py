@@ -0,0 +1,39 @@
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    # RFC 9562 version 7: 48-bit Unix time in milliseconds followed by random bits, so new rows are
+    # appended to the right edge of the primary key index instead of landing on a random page.
+    # The 12-bit rand_a field is a counter that keeps ids of the same millisecond in creation order.
+    global _last_ms, _counter
+
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Random start in the lower half leaves room to count up
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7ff
+        else:
+            # Same millisecond, or the clock went back: stay monotonic
+            _counter += 1
+            if _counter > 0xfff:
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+
+    random_bits = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    return uuid.UUID(int=(timestamp << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits)
+
+
+def uuid7_time(value):
+    # Creation time of a version 7 id in Unix milliseconds, None for other versions
+    if value.version != 7:
+        return None
+    return value.int >> 80
@@ -0,0 +1,74 @@
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+FORMAT_EXTENSIONS = {
+    "webp": "webp",
+    "jpeg": "jpg",
+}
+
+
+def build_renditions(field_file):
+    # Sized copies of an uploaded image: auto-oriented, EXIF stripped, re-encoded.
+    # Returns {"<size>": {"<format>": "<storage name>"}}, or {} for files Pillow cannot read (svg, heic)
+    # or will not decode: more than twice Image.MAX_IMAGE_PIXELS is a decompression bomb
+    try:
+        with field_file.open('rb') as source:
+            image = Image.open(source)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return {}
+
+    image = ImageOps.exif_transpose(image)
+    directory, filename = posixpath.split(field_file.name)
+    stem = posixpath.splitext(filename)[0]
+
+    renditions = {}
+    for size in settings.IMAGE_RENDITION_SIZES:
+        resized = image.copy()
+        # thumbnail() keeps the aspect ratio and never upscales
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        renditions[str(size)] = {
+            image_format: save_rendition(field_file.storage, resized, image_format,
+                                         posixpath.join(directory, "renditions", f"{stem}-{size}"))
+            for image_format in settings.IMAGE_RENDITION_FORMATS
+        }
+    return renditions
+
+
+def save_rendition(storage, image, image_format, name):
+    if image_format == "jpeg" and image.mode != "RGB":
+        image = flatten(image)
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    buffer = io.BytesIO()
+    # No exif= argument: the metadata of the original is not carried over
+    image.save(buffer, format=image_format.upper(), quality=settings.IMAGE_RENDITION_QUALITY, optimize=True)
+    return storage.save(f"{name}.{FORMAT_EXTENSIONS[image_format]}", ContentFile(buffer.getvalue()))
+
+
+def flatten(image):
+    image = image.convert("RGBA")
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def delete_renditions(storage, renditions):
+    for formats in (renditions or {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def rendition_urls(storage, renditions, request=None):
+    urls = {}
+    for size, formats in (renditions or {}).items():
+        urls[size] = {}
+        for image_format, name in formats.items():
+            url = storage.url(name)
+            urls[size][image_format] = request.build_absolute_uri(url) if request is not None else url
+    return urls
@@ -0,0 +1,72 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.utils.http import http_date
+from django.views.static import serve
+
+from shared.media import serve_media
+
+
+class Command(BaseCommand):
+    help = "Benchmark media serving: shared.media.serve_media vs django.views.static.serve, in process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[64 * 1024, 1024 * 1024, 8 * 1024 * 1024])
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--range-size', type=int, default=64 * 1024)
+
+    def handle(self, *args, **options):
+        self.options = options
+        factory = RequestFactory()
+        self.stdout.write(f"{'size':>10} {'case':<12} {'view':<8} {'req/s':>10} {'MB/s':>10} {'p95 ms':>8} {'bytes':>10}")
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, MEDIA_SENDFILE_BACKEND=''):
+            for size in options['sizes']:
+                name = f"blobs/be/nc/bench{size}.jpg"
+                path = os.path.join(media_root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as handle:
+                    handle.write(os.urandom(size))
+                modified = http_date(int(os.stat(path).st_mtime))
+
+                cases = (
+                    ('full', {}),
+                    # Revalidation by a client that already has the file
+                    ('conditional', {'HTTP_IF_MODIFIED_SINCE': modified}),
+                    # Seeking in a video or resuming a download
+                    ('range', {'HTTP_RANGE': f"bytes={size // 2}-{size // 2 + options['range_size'] - 1}"}),
+                )
+                for case, headers in cases:
+                    for label, view in (('static', lambda request: serve(request, name, document_root=media_root)),
+                                        ('media', lambda request: serve_media(request, name))):
+                        timings, sent = self.measure(lambda: view(factory.get(f"/media/{name}", **headers)))
+                        seconds = sum(timings) / 1000
+                        self.stdout.write(
+                            f"{size:>10} {case:<12} {label:<8} {len(timings) / seconds:>10.0f} "
+                            f"{sent * len(timings) / seconds / 1024 / 1024:>10.1f} {self.p(timings, 95):>8.2f} {sent:>10}"
+                        )
+
+    def measure(self, call):
+        timings = []
+        sent = 0
+        for _ in range(self.options['repeat']):
+            started = time.perf_counter()
+            response = call()
+            if response.streaming:
+                sent = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                sent = len(response.content)
+            response.close()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings, sent
+
+    @staticmethod
+    def p(timings, percentile):
+        if len(timings) < 2:
+            return timings[0]
+        return statistics.quantiles(timings, n=100)[percentile - 1]
@@ -0,0 +1,99 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from shared.notifications import EMAIL, get_transport, verification_code_message
+from shared.tasks import send_notification_task, send_notification_batch_task
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib: accepts and discards every message
+    def handle(self):
+        # Stands in for the TCP + TLS handshake and login of a remote server
+        time.sleep(self.server.handshake_delay)
+        self.reply(b"220 sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply(b"250 sink")
+            elif command == b"DATA":
+                self.reply(b"354 end with <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.received += 1
+                self.reply(b"250 queued")
+            elif command == b"QUIT":
+                self.reply(b"221 bye")
+                return
+            else:
+                self.reply(b"250 ok")
+
+    def reply(self, line):
+        self.wfile.write(line + b"\r\n")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_delay):
+        super(SMTPSink, self).__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.handshake_delay = handshake_delay
+        self.received = 0
+
+
+class Command(BaseCommand):
+    help = "Benchmark verification emails against a local SMTP sink: a new connection per message " \
+           "(the previous send_email) vs send_notification_task on a pooled connection vs send_notification_batch_task."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--handshake-ms', type=float, default=50.0,
+                            help="Delay before the greeting, for the handshake a remote server costs.")
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['handshake_ms'] / 1000)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        host, port = sink.server_address
+        messages = [verification_code_message(EMAIL, f"user{i}@example.com", f"{i:04d}")
+                    for i in range(options['messages'])]
+
+        smtp = dict(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST=host, EMAIL_PORT=port,
+                    EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='')
+        self.stdout.write(f"{'mode':<16} {'messages':>9} {'seconds':>9} {'msg/s':>9} {'received':>9}")
+        try:
+            with override_settings(**smtp):
+                for mode, send in (('per-message', self.send_per_message),
+                                   ('pooled', self.send_pooled),
+                                   ('batch', lambda batch: send_notification_batch_task.apply(args=[batch]))):
+                    sink.received = 0
+                    started = time.perf_counter()
+                    send(messages)
+                    seconds = time.perf_counter() - started
+                    self.stdout.write(f"{mode:<16} {len(messages):>9} {seconds:>9.2f} "
+                                      f"{len(messages) / seconds:>9.0f} {sink.received:>9}")
+        finally:
+            get_transport(EMAIL).get_connection().close()
+            sink.shutdown()
+            sink.server_close()
+
+    @staticmethod
+    def send_per_message(messages):
+        for message in messages:
+            email = EmailMessage(subject=message['subject'], body=message['body'], to=[message['to']],
+                                 connection=get_connection(fail_silently=False))
+            email.content_subtype = "html"
+            email.send()
+
+    @staticmethod
+    def send_pooled(messages):
+        # What a worker does for a series of send_notification_task messages
+        for message in messages:
+            send_notification_task.apply(args=[message], throw=True)
@@ -0,0 +1,62 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from shared.ids import uuid7
+
+GENERATORS = {
+    'v4': uuid.uuid4,
+    'v7': uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark inserts into a UUID primary key: random version 4 vs time-ordered version 7 ids. " \
+           "Uses temporary tables inside a rolled-back transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Index sizes are read from PostgreSQL.")
+
+        self.stdout.write(f"{'ids':<4} {'rows':>10} {'rows/s':>10} {'last batch ms':>14} {'index MB':>9} {'table MB':>9}")
+        for name, generate in GENERATORS.items():
+            with transaction.atomic():
+                self.stdout.write(self.run(name, generate, options))
+                transaction.set_rollback(True)
+
+    def run(self, name, generate, options):
+        table = f"bench_uuid_{name}"
+        with connection.cursor() as cursor:
+            # Same shape as a like row: uuid pk, two foreign keys, a timestamp
+            cursor.execute(
+                f"CREATE TEMP TABLE {table} (id uuid PRIMARY KEY, author_id uuid NOT NULL, "
+                f"post_id uuid NOT NULL, created_at timestamptz NOT NULL DEFAULT now())"
+            )
+            author_id, post_id = uuid.uuid4(), uuid.uuid4()
+
+            elapsed = 0
+            batch_ms = 0
+            inserted = 0
+            while inserted < options['rows']:
+                size = min(options['batch_size'], options['rows'] - inserted)
+                ids = [generate() for _ in range(size)]
+                started = time.perf_counter()
+                cursor.execute(
+                    f"INSERT INTO {table} (id, author_id, post_id) SELECT unnest(%s::uuid[]), %s, %s",
+                    [ids, author_id, post_id],
+                )
+                batch_ms = (time.perf_counter() - started) * 1000
+                elapsed += batch_ms / 1000
+                inserted += size
+
+            cursor.execute(f"SELECT pg_relation_size('{table}_pkey'), pg_relation_size('{table}')")
+            index_size, table_size = cursor.fetchone()
+
+        return f"{name:<4} {inserted:>10} {inserted / elapsed:>10.0f} {batch_ms:>14.1f} " \
+               f"{index_size / 1024 / 1024:>9.1f} {table_size / 1024 / 1024:>9.1f}"
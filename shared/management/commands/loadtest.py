@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Load test running servers with many concurrent connections, e.g. the same code served by " \
+           "config/wsgi.py (gunicorn) and by config/asgi.py (uvicorn): " \
+           "loadtest --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001 --token <access>"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', dest='targets', default=[],
+                            help="name=base URL, repeat to compare deployments.")
+        parser.add_argument('--path', action='append', dest='paths', default=[],
+                            help="Request path, repeat to cycle through several (default: /api/posts/).")
+        parser.add_argument('--token', help="JWT access token sent as a Bearer token.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per target and concurrency.")
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, separator, url = target.partition('=')
+            if not separator or not url.startswith(('http://', 'https://')):
+                raise CommandError(f"Expected name=http://host:port, got {target!r}")
+            targets.append((name, url.rstrip('/')))
+        if not targets:
+            raise CommandError("At least one --target is required.")
+
+        self.options = options
+        self.paths = options['paths'] or ['/api/posts/']
+        self.stdout.write(f"{'target':<10} {'conns':>6} {'requests':>9} {'errors':>7} {'req/s':>9} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for concurrency in options['concurrency']:
+            for name, url in targets:
+                timings, errors, seconds = asyncio.run(self.run(url, concurrency))
+                self.stdout.write(
+                    f"{name:<10} {concurrency:>6} {len(timings) + errors:>9} {errors:>7} "
+                    f"{len(timings) / seconds:>9.0f} {self.p(timings, 50):>8.1f} {self.p(timings, 95):>8.1f} "
+                    f"{self.p(timings, 99):>8.1f}"
+                )
+
+    async def run(self, url, concurrency):
+        headers = {'Accept': 'application/json'}
+        if self.options['token']:
+            headers['Authorization'] = f"Bearer {self.options['token']}"
+        # One keep-alive connection per client, like that many browsers or app instances
+        connector = aiohttp.TCPConnector(limit=concurrency, force_close=False)
+        timeout = aiohttp.ClientTimeout(total=self.options['timeout'])
+        timings, errors = [], 0
+
+        async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+            deadline = time.perf_counter() + self.options['duration']
+
+            async def client(offset):
+                nonlocal errors
+                sent = offset
+                while time.perf_counter() < deadline:
+                    path = self.paths[sent % len(self.paths)]
+                    sent += 1
+                    started = time.perf_counter()
+                    try:
+                        async with session.get(url + path) as response:
+                            await response.read()
+                            ok = response.status < 400
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        ok = False
+                    if ok:
+                        timings.append((time.perf_counter() - started) * 1000)
+                    else:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+            seconds = time.perf_counter() - started
+        return timings, errors, seconds
+
+    @staticmethod
+    def p(timings, percentile):
+        if not timings:
+            return 0.0
+        if len(timings) < 2:
+            return timings[0]
+        return statistics.quantiles(timings, n=100)[percentile - 1]
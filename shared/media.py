@@ -0,0 +1,163 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import BLOB_PREFIX
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class RangeFile:
+    # Stops reading at the end of the requested range. fileno()/tell() stay available,
+    # so a WSGI file_wrapper (gunicorn) still sends the range with os.sendfile()
+    def __init__(self, file, end):
+        self.file = file
+        self.end = end
+        self.name = file.name
+
+    def read(self, size=-1):
+        remaining = self.end - self.file.tell()
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def is_immutable(path):
+    # Content-addressed names change whenever the content does
+    return path.startswith(f"{BLOB_PREFIX}/") and not path.startswith(f"{BLOB_PREFIX}/tmp/")
+
+
+def media_etag(path, stat):
+    if is_immutable(path):
+        return '"%s"' % posixpath.splitext(posixpath.basename(path))[0]
+    return '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+
+def cache_control(path):
+    if is_immutable(path):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+
+
+def parse_range(header, size):
+    # A single "bytes=" range as (start, end) with end exclusive; None serves the whole file.
+    # Multiple ranges are answered with the whole file, which RFC 9110 allows
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return ()
+        return max(size - length, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return ()
+    return start, end
+
+
+def range_applies(request, etag, last_modified):
+    # If-Range: only honour Range when the client's copy is still current
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def resolve(path):
+    path = posixpath.normpath(path).lstrip('/')
+    # Unfinished chunked uploads and blob temp files are never served
+    if path.endswith('.part') or path.startswith(f"{BLOB_PREFIX}/tmp/"):
+        raise Http404
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    return path, fullpath
+
+
+def offload(path, fullpath, content_type):
+    # The front server sends the bytes and handles ranges itself
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE_BACKEND == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{path}")
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    path, fullpath = resolve(path)
+    stat = os.stat(fullpath)
+    etag = media_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+
+        if settings.MEDIA_SENDFILE_BACKEND:
+            response = offload(path, fullpath, content_type)
+        else:
+            byte_range = None
+            if 'HTTP_RANGE' in request.META and range_applies(request, etag, last_modified):
+                byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+
+            if byte_range == ():
+                response = HttpResponse(status=416, content_type=content_type)
+                response['Content-Range'] = f"bytes */{stat.st_size}"
+            elif byte_range:
+                start, end = byte_range
+                handle = open(fullpath, 'rb')
+                handle.seek(start)
+                response = FileResponse(RangeFile(handle, end), status=206, content_type=content_type)
+                response['Content-Length'] = end - start
+                response['Content-Range'] = f"bytes {start}-{end - 1}/{stat.st_size}"
+            else:
+                response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+                response['Content-Length'] = stat.st_size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+
+    # Also on 304 responses, so caches refresh what they stored
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control(path)
+    return response
@@ -0,0 +1,39 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, generate_latest
+
+# Per process. With several worker processes set PROMETHEUS_MULTIPROC_DIR (prometheus_client multiprocess mode)
+REPRESENTATION_CACHE_LOOKUPS = Counter(
+    'representation_cache_lookups_total',
+    'Serialized object lookups in the representation cache',
+    ['kind', 'result'],
+)
+
+NOTIFICATIONS = Counter(
+    'notifications_total',
+    'Outbound emails and SMS by outcome: sent, retried, failed, dropped (local queue full)',
+    ['channel', 'result'],
+)
+
+TOKENS_MINTED = Counter(
+    'auth_tokens_minted_total',
+    'Refresh/access token pairs minted, by endpoint',
+    ['endpoint'],
+)
+
+
+def metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    # Not found rather than forbidden, so the endpoint is not advertised
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:02
+
+import shared.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared', '0002_mediablob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mediablob',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -1,11 +1,73 @@
 from django.db import models
-import uuid
+
+from .ids import uuid7
 
 # Create your models here.
 class BaseModel(models.Model):
-    id = models.UUIDField(unique=True, default=uuid.uuid4, editable=False, primary_key=True)
+    # Time-ordered: rows created before the switch keep their random version 4 ids
+    id = models.UUIDField(unique=True, default=uuid7, editable=False, primary_key=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         abstract = True
+
+
+class AuthorQuerySet(models.QuerySet):
+    # Author columns rendered by users.serializers.UserSerializer, updated_at is its memo version
+    author_fields = ('id', 'username', 'photo', 'photo_renditions', 'updated_at')
+
+    def with_author(self):
+        fields = [field.name for field in self.model._meta.concrete_fields]
+        author_fields = [f'author__{name}' for name in self.author_fields]
+        return self.select_related('author').only(*fields, *author_fields)
+
+
+# Every queryset of an authored model joins its author, without password hash and other unused user columns
+class AuthorManager(models.Manager.from_queryset(AuthorQuerySet)):
+    def get_queryset(self):
+        return super(AuthorManager, self).get_queryset().with_author()
+
+
+POST_IMAGE, USER_PHOTO = ('post_image', 'user_photo')
+PENDING, COMPLETED = ('pending', 'completed')
+
+class UploadSession(BaseModel):
+    TARGETS = (
+        (POST_IMAGE, POST_IMAGE),
+        (USER_PHOTO, USER_PHOTO),
+    )
+    STATUSES = (
+        (PENDING, PENDING),
+        (COMPLETED, COMPLETED),
+    )
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='uploads')
+    target = models.CharField(max_length=32, choices=TARGETS)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    # Storage name the chunks are written to, next to the final file
+    path = models.CharField(max_length=255)
+    status = models.CharField(max_length=32, choices=STATUSES, default=PENDING)
+
+    class Meta:
+        db_table = "upload_sessions"
+        verbose_name = "upload session"
+        verbose_name_plural = "upload sessions"
+
+    def __str__(self):
+        return f'{self.filename} ({self.received_size}/{self.total_size})'
+
+
+class MediaBlob(BaseModel):
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = "media_blobs"
+        verbose_name = "media blob"
+        verbose_name_plural = "media blobs"
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count})'
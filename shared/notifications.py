@@ -0,0 +1,309 @@
+import json
+import logging
+import smtplib
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from celery.utils.time import get_exponential_backoff_interval
+from decouple import config
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+from kombu.exceptions import OperationalError
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from .metrics import NOTIFICATIONS
+
+logger = logging.getLogger(__name__)
+
+EMAIL, SMS = ('email', 'sms')
+
+# A notification is a JSON-serializable dict: {"channel", "to", "body"} plus "subject" and
+# "content_type" for emails. dispatch() hands it to send_notification_task, or to a bounded
+# thread pool in this process when no broker is configured or reachable, so requests never
+# wait on SMTP or SMS I/O. Verification codes can go through a queue that is sent in batches
+# instead (NOTIFICATION_QUEUE_ENABLED). Transports (NOTIFICATION_TRANSPORTS) do the actual sending.
+
+
+class Transport(ABC):
+
+    @abstractmethod
+    def send(self, message):
+        pass
+
+    def send_many(self, messages):
+        # Returns [(message, exception)] for the messages that failed
+        failures = []
+        for message in messages:
+            try:
+                self.send(message)
+            except Exception as exc:
+                failures.append((message, exc))
+        return failures
+
+    @staticmethod
+    def is_transient(exc):
+        return False
+
+
+class EmailTransport(Transport):
+    # One SMTP connection per worker process or thread, kept open between messages instead of a
+    # TCP + TLS handshake and login for each. Reopened when the server dropped it or after
+    # EMAIL_CONNECTION_MAX_IDLE seconds without use, before the server's own idle timeout
+    def __init__(self):
+        self.local = threading.local()
+
+    def get_connection(self):
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = get_connection(fail_silently=False)
+            self.local.last_used = 0
+        elif time.monotonic() - self.local.last_used > settings.EMAIL_CONNECTION_MAX_IDLE:
+            self.local.connection.close()
+        return self.local.connection
+
+    def send(self, message):
+        connection = self.get_connection()
+        email = EmailMessage(subject=message['subject'], body=message['body'], to=[message['to']],
+                             connection=connection)
+        if message.get('content_type') == "html":
+            email.content_subtype = "html"
+
+        try:
+            try:
+                connection.open()
+                connection.send_messages([email])
+            except smtplib.SMTPServerDisconnected:
+                # Closed by the server since the last message: reconnect once
+                connection.close()
+                connection.open()
+                connection.send_messages([email])
+        except Exception:
+            # The session may be left mid-transaction, the next message starts a new one
+            connection.close()
+            raise
+        self.local.last_used = time.monotonic()
+
+    @staticmethod
+    def is_transient(exc):
+        # Lost connections and 4xx replies are retried; refused recipients and 5xx replies are not
+        if isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+            return True
+        if isinstance(exc, smtplib.SMTPResponseException):
+            return 400 <= exc.smtp_code < 500
+        return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+class TwilioSmsTransport(Transport):
+    # One client per process: credentials are read once and its HTTP session keeps the
+    # connection to the Twilio API alive between messages
+    def __init__(self):
+        self.client = Client(config('account_sid'), config('auth_token'),
+                             http_client=TwilioHttpClient(timeout=settings.NOTIFICATION_SMS_TIMEOUT))
+        self.from_ = config('phone_number')
+
+    def send(self, message):
+        self.client.messages.create(body=message['body'], from_=self.from_, to=message['to'])
+
+    @staticmethod
+    def is_transient(exc):
+        if isinstance(exc, TwilioRestException):
+            return exc.status == 429 or exc.status >= 500
+        return isinstance(exc, OSError)
+
+
+class LocmemTransport(Transport):
+    # For tests and development: keeps the messages, like django.core.mail.outbox
+    outbox = []
+
+    def send(self, message):
+        self.outbox.append(message)
+
+
+@lru_cache(maxsize=None)
+def load_transport(path):
+    return import_string(path)()
+
+
+def get_transport(channel):
+    return load_transport(settings.NOTIFICATION_TRANSPORTS[channel])
+
+
+def deliver(message):
+    get_transport(message['channel']).send(message)
+    NOTIFICATIONS.labels(message['channel'], 'sent').inc()
+
+
+def deliver_many(messages):
+    # Messages of a channel go out back to back on its transport's connection.
+    # Returns [(message, exception)] for the messages that failed
+    failures = []
+    for channel in {message['channel'] for message in messages}:
+        batch = [message for message in messages if message['channel'] == channel]
+        failed = get_transport(channel).send_many(batch)
+        NOTIFICATIONS.labels(channel, 'sent').inc(len(batch) - len(failed))
+        failures.extend(failed)
+    return failures
+
+
+def retry_delay(retries):
+    return get_exponential_backoff_interval(
+        factor=settings.NOTIFICATION_RETRY_BACKOFF, retries=retries,
+        maximum=settings.NOTIFICATION_RETRY_BACKOFF_MAX, full_jitter=True,
+    )
+
+
+def dispatch(message):
+    # After the surrounding transaction commits, so the code being sent has been saved
+    transaction.on_commit(lambda: enqueue(message))
+
+
+def enqueue(message):
+    # shared.tasks imports this module
+    from .tasks import send_notification_task
+
+    if settings.CELERY_BROKER_URL:
+        try:
+            send_notification_task.apply_async(args=[message], retry=False)
+            return
+        except OperationalError:
+            logger.warning("Broker unavailable, sending the %s notification from this process", message['channel'])
+    submit_local(message)
+
+
+# Fallback when there is no broker: a few threads in the web process, and a bounded number of
+# waiting messages so that a dead SMTP server cannot pile up memory and threads under load
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.NOTIFICATION_THREAD_POOL_SIZE,
+                                           thread_name_prefix='notifications')
+            _slots = threading.BoundedSemaphore(
+                settings.NOTIFICATION_THREAD_POOL_SIZE + settings.NOTIFICATION_THREAD_POOL_QUEUE
+            )
+    return _executor, _slots
+
+
+def submit_local(message):
+    executor, slots = get_executor()
+    if not slots.acquire(blocking=False):
+        NOTIFICATIONS.labels(message['channel'], 'dropped').inc()
+        logger.error("Notification queue full, dropping the %s notification to %s", message['channel'], message['to'])
+        return
+    executor.submit(send_local, message, slots)
+
+
+def send_local(message, slots):
+    transport = get_transport(message['channel'])
+    try:
+        for retries in range(settings.NOTIFICATION_MAX_RETRIES + 1):
+            try:
+                deliver(message)
+                return
+            except Exception as exc:
+                if retries == settings.NOTIFICATION_MAX_RETRIES or not transport.is_transient(exc):
+                    NOTIFICATIONS.labels(message['channel'], 'failed').inc()
+                    logger.exception("Sending the %s notification to %s failed", message['channel'], message['to'])
+                    return
+                NOTIFICATIONS.labels(message['channel'], 'retried').inc()
+                time.sleep(retry_delay(retries))
+    finally:
+        slots.release()
+
+
+def verification_code_message(channel, to, code):
+    if channel == EMAIL:
+        return {
+            "channel": EMAIL,
+            "to": to,
+            "subject": "Activate Your Account",
+            "body": render_to_string('email/authentication/activate_account.html', {"code": code}),
+            "content_type": "html",
+        }
+    return {
+        "channel": SMS,
+        "to": str(to),
+        "body": f"Hello my friend !\n Your confirmed code : {code}",
+    }
+
+
+# With NOTIFICATION_QUEUE_ENABLED, verification codes are queued instead of getting a task each, and
+# flush_notification_queue_task sends what has accumulated every few seconds in batches of
+# NOTIFICATION_QUEUE_BATCH_SIZE, over one SMTP connection per batch (send_notification_batch_task)
+
+
+class LocalNotificationQueue:
+    # In-process stand-in for tests and single-process development: the flush has to run in the
+    # process that queued the messages (e.g. CELERY_TASK_ALWAYS_EAGER)
+
+    def __init__(self, location=None):
+        self.lock = threading.Lock()
+        self.messages = deque()
+
+    def push(self, message):
+        with self.lock:
+            self.messages.append(message)
+
+    def pop(self, limit):
+        with self.lock:
+            return [self.messages.popleft() for _ in range(min(limit, len(self.messages)))]
+
+
+class RedisNotificationQueue:
+    key = "notifications:queue"
+
+    def __init__(self, location):
+        import redis
+
+        self.client = redis.Redis.from_url(location, decode_responses=True)
+
+    def push(self, message):
+        self.client.rpush(self.key, json.dumps(message))
+
+    def pop(self, limit):
+        # LPOP with a count (Redis 6.2+): the batch leaves the queue atomically
+        return [json.loads(message) for message in self.client.lpop(self.key, limit) or []]
+
+
+@lru_cache(maxsize=None)
+def load_notification_queue(backend, location):
+    return import_string(backend)(location)
+
+
+def get_notification_queue():
+    # None unless NOTIFICATION_QUEUE_ENABLED: every message then gets its own task
+    if not settings.NOTIFICATION_QUEUE_ENABLED:
+        return None
+    return load_notification_queue(settings.NOTIFICATION_QUEUE_BACKEND, settings.NOTIFICATION_QUEUE_LOCATION)
+
+
+def queue(message):
+    try:
+        get_notification_queue().push(message)
+    except Exception:
+        logger.warning("Notification queue unavailable, dispatching the %s notification", message['channel'],
+                       exc_info=True)
+        enqueue(message)
+
+
+def send_verification_code(channel, to, code):
+    message = verification_code_message(channel, to, code)
+    if get_notification_queue() is None:
+        dispatch(message)
+    else:
+        # After the surrounding transaction commits, like dispatch()
+        transaction.on_commit(lambda: queue(message))
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.validators import MaxLengthValidator
+from rest_framework import serializers
+from rest_framework.validators import ValidationError
+
+from .models import UploadSession, POST_IMAGE
+from .uploads import allowed_extensions, file_extension
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ('id',
+                  'target',
+                  'filename',
+                  'total_size',
+                  'received_size',
+                  'status')
+        read_only_fields = ('received_size', 'status')
+
+    def validate(self, data):
+        target = data.get('target')
+        if file_extension(data.get('filename')) not in allowed_extensions(target):
+            error = {
+                "success":False,
+                "message":f"Allowed extensions: {', '.join(allowed_extensions(target))}."
+            }
+            raise ValidationError(error)
+
+        if data.get('total_size') > settings.UPLOAD_MAX_SIZE[target]:
+            error = {
+                "success":False,
+                "message":f"File is larger than {settings.UPLOAD_MAX_SIZE[target]} bytes."
+            }
+            raise ValidationError(error)
+
+        return data
+
+
+class UploadCompleteSerializer(serializers.Serializer):
+    caption = serializers.CharField(required=False, validators=[MaxLengthValidator(3000)])
+
+    def validate(self, data):
+        session = self.context.get('session')
+        if session.target == POST_IMAGE and not data.get('caption'):
+            error = {
+                "success":False,
+                "message":"Caption is required for a post."
+            }
+            raise ValidationError(error)
+
+        return data
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    # Every file is stored once under blobs/<hash>.<ext>, whatever name it was uploaded with.
+    # MediaBlob counts the fields referencing a blob; the file is removed with the last reference.
+
+    def _save(self, name, content):
+        extension = posixpath.splitext(name)[1].lower()
+        digest = hashlib.blake2b(digest_size=20)
+
+        temp_path = None
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk (large uploads, chunked uploads): hash it and move it, no extra copy
+            source = content.temporary_file_path()
+            for chunk in content.chunks():
+                digest.update(chunk)
+        else:
+            temp_dir = self.path(posixpath.join(BLOB_PREFIX, 'tmp'))
+            os.makedirs(temp_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            source = temp_path
+
+        name = self.blob_name(digest.hexdigest(), extension)
+        path = self.path(name)
+        try:
+            with transaction.atomic():
+                self.add_reference(name, os.path.getsize(source))
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    file_move_safe(source, path, allow_overwrite=True)
+                    temp_path = None
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save()
+        return name
+
+    def delete(self, name):
+        # Files go once the transaction releasing them commits: a rollback brings the rows back, and the file is still there
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        if not name.startswith(f"{BLOB_PREFIX}/"):
+            # Files stored before content addressing was introduced
+            transaction.on_commit(lambda: super(ContentAddressedStorage, self).delete(name))
+            return
+
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                MediaBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') - 1)
+                return
+            blob.delete()
+        transaction.on_commit(lambda: self.remove_unreferenced(name))
+
+    def remove_unreferenced(self, name):
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            # The placeholder row holds off saves of the same content until the file is gone; a save
+            # that committed since the release owns the row, and the file stays
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': 0, 'ref_count': 0}
+            )
+            if created:
+                super(ContentAddressedStorage, self).delete(name)
+                blob.delete()
+
+    @staticmethod
+    def add_reference(name, size):
+        from .models import MediaBlob
+
+        blob, created = MediaBlob.objects.select_for_update().get_or_create(name=name, defaults={'size': size})
+        if not created:
+            MediaBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + 1)
+
+    @staticmethod
+    def blob_name(digest, extension):
+        return posixpath.join(BLOB_PREFIX, digest[:2], digest[2:4], f"{digest}{extension}")
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def media_storage():
+    return content_addressed_storage
@@ -0,0 +1,72 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import NOTIFICATIONS
+from .models import UploadSession, PENDING
+from .notifications import deliver, deliver_many, get_notification_queue, get_transport, retry_delay
+from .uploads import discard
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, acks_late=True)
+def send_notification_task(self, message):
+    try:
+        deliver(message)
+    except Exception as exc:
+        if self.request.retries >= settings.NOTIFICATION_MAX_RETRIES \
+                or not get_transport(message['channel']).is_transient(exc):
+            NOTIFICATIONS.labels(message['channel'], 'failed').inc()
+            raise
+        NOTIFICATIONS.labels(message['channel'], 'retried').inc()
+        raise self.retry(exc=exc, countdown=retry_delay(self.request.retries), max_retries=None)
+
+
+@shared_task(acks_late=True)
+def send_notification_batch_task(messages):
+    # Sent over one connection per channel; failures that are worth retrying go back to the
+    # queue one by one with send_notification_task's backoff
+    for message, exc in deliver_many(messages):
+        if get_transport(message['channel']).is_transient(exc):
+            NOTIFICATIONS.labels(message['channel'], 'retried').inc()
+            send_notification_task.apply_async(args=[message], countdown=retry_delay(0))
+        else:
+            NOTIFICATIONS.labels(message['channel'], 'failed').inc()
+            logger.error("Sending the %s notification to %s failed: %r", message['channel'], message['to'], exc)
+
+
+@shared_task
+def flush_notification_queue_task():
+    # Periodic (CELERY_BEAT_SCHEDULE): sends the queued verification codes in batches.
+    # Popped messages are sent right here, a worker lost mid-batch loses that batch
+    queue = get_notification_queue()
+    if queue is None:
+        return 0
+    sent = 0
+    while True:
+        messages = queue.pop(settings.NOTIFICATION_QUEUE_BATCH_SIZE)
+        if not messages:
+            return sent
+        send_notification_batch_task(messages)
+        sent += len(messages)
+
+
+@shared_task
+def expire_upload_sessions_task():
+    # Periodic (CELERY_BEAT_SCHEDULE): pending uploads older than UPLOAD_SESSION_EXPIRY are abandoned,
+    # their part files and rows go in batches. A chunk still arriving for one of them gets a 404
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)
+    expired = UploadSession.objects.filter(status=PENDING, created_at__lt=cutoff).order_by('id')
+    deleted = 0
+    while True:
+        sessions = list(expired.values_list('id', 'path')[:settings.UPLOAD_SESSION_EXPIRY_BATCH_SIZE])
+        if not sessions:
+            break
+        for _, path in sessions:
+            discard(path)
+        deleted += UploadSession.objects.filter(id__in=[session_id for session_id, _ in sessions], status=PENDING).delete()[0]
+    return deleted
@@ -1,3 +1,330 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from post.models import Post
+from shared.count_strategy import CachedCount
+from shared.images import build_renditions
+from shared.models import MediaBlob, UploadSession, PENDING, COMPLETED
+from shared.storage import content_addressed_storage
+from shared.tasks import expire_upload_sessions_task
+from shared.uploads import ChunkConflict, locked_part, write_chunk
+from shared.views import UploadSessionCompleteApiView
+from users.models import User, DONE
+
+
+class MetricsAccessTests(TestCase):
+    # /metrics/ is only served to the scraper: a bearer token or an allowed address
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_closed_by_default(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=[])
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'auth_tokens_minted_total', response.content)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_ips(self):
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.6').status_code, 404)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class RenditionTests(TestCase):
+
+    def setUp(self):
+        self.storage = FileSystemStorage(location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.storage.location)
+
+    def upload(self, size):
+        buffer = io.BytesIO()
+        Image.new("RGB", size).save(buffer, format="PNG")
+        return FieldFile(None, SimpleNamespace(storage=self.storage), self.storage.save("bomb.png", buffer))
+
+    def test_decompression_bomb_gets_no_renditions(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            self.assertEqual(build_renditions(self.upload((100, 100))), {})
+        self.assertEqual(self.storage.listdir("")[1], ["bomb.png"])
+
+
+class MediaServingTests(TestCase):
+    # shared/media.py: ranges, conditional requests and the front server hand-off
+    content = b"0123456789abcdef"
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, MEDIA_SENDFILE_BACKEND='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        os.makedirs(os.path.join(media_root, 'post-images'))
+        self.path = os.path.join(media_root, 'post-images', 'photo.jpg')
+        with open(self.path, 'wb') as handle:
+            handle.write(self.content)
+        self.url = '/media/post-images/photo.jpg'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    @staticmethod
+    def body(response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-3': (0, 4),
+            'bytes=10-': (10, 16),
+            'bytes=-4': (12, 16),
+            'bytes=14-100': (14, 16),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(self.body(response), self.content[start:end])
+                self.assertEqual(response['Content-Range'], f"bytes {start}-{end - 1}/{len(self.content)}")
+                self.assertEqual(response['Content-Length'], str(end - start))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=16-', 'bytes=5-2', 'bytes=-0'):
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], f"bytes */{len(self.content)}")
+
+    def test_malformed_or_stale_range_serves_whole_file(self):
+        etag = self.get()['ETag']
+        for headers in ({'HTTP_RANGE': 'items=0-3'}, {'HTTP_RANGE': 'bytes=0-1,4-5'},
+                        {'HTTP_RANGE': 'bytes=0-3', 'HTTP_IF_RANGE': '"stale"'}):
+            with self.subTest(headers):
+                response = self.get(**headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.body(response), self.content)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_not_modified(self):
+        response = self.get()
+        for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            with self.subTest(headers):
+                not_modified = self.get(**headers)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+                self.assertEqual(not_modified.content, b'')
+
+    def test_sendfile_backends(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.get(HTTP_RANGE='bytes=0-3')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/post-images/photo.jpg')
+            self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-sendfile'):
+            self.assertEqual(self.get()['X-Sendfile'], self.path)
+
+    def test_blobs_are_immutable_and_parts_hidden(self):
+        name = content_addressed_storage.save('photo.jpg', ContentFile(self.content))
+        response = self.client.get(f'/media/{name}')
+        self.addCleanup(response.close)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], '"%s"' % os.path.splitext(os.path.basename(name))[0])
+
+        os.rename(self.path, f"{self.path}.part")
+        self.assertEqual(self.client.get(f"{self.url}.part").status_code, 404)
+
+
+class BlobStorageTests(TestCase):
+    # One file per content, counted by MediaBlob; the file goes when its last reference is committed away
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = content_addressed_storage
+
+    def save(self, content=b"same bytes"):
+        return self.storage.save("upload.jpg", ContentFile(content))
+
+    def refs(self, name):
+        return MediaBlob.objects.filter(name=name).values_list('ref_count', flat=True).first()
+
+    def test_same_content_is_stored_once(self):
+        name = self.save()
+        self.assertEqual(self.save(), name)
+        self.assertNotEqual(self.save(b"other bytes"), name)
+        self.assertEqual(self.refs(name), 2)
+
+    def test_file_goes_with_last_reference(self):
+        name = self.save()
+        self.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(self.storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertIsNone(self.refs(name))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_rolled_back_release_keeps_file(self):
+        name = self.save()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.storage.delete(name)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(self.storage.exists(name))
+
+    def test_cascade_releases_references(self):
+        user = User.objects.create(username="owner", auth_status=DONE, photo=self.save(b"photo"))
+        image = self.save()
+        Post.objects.create(author=user, caption="post", image=image,
+                            image_renditions={"150": {"jpeg": self.save(b"rendition")}})
+        Post.objects.create(author=user, caption="copy", image=self.save())
+        self.assertEqual(self.refs(image), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(self.storage.exists(image))
+
+
+class TrickleStream:
+    # A request body that arrives a few bytes per read
+    def __init__(self, content, step=3):
+        self.content, self.step = io.BytesIO(content), step
+
+    def read(self, size):
+        return self.content.read(min(size, self.step))
+
+
+class UploadSessionTests(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create(username="uploader", auth_status=DONE)
+        self.client.force_authenticate(self.user)
+        buffer = io.BytesIO()
+        Image.new("RGB", (32, 32), (200, 10, 10)).save(buffer, format="WEBP")
+        self.content = buffer.getvalue()
+
+    def start(self):
+        response = self.client.post('/api/uploads/', {
+            'target': 'post_image', 'filename': 'photo.webp', 'total_size': len(self.content),
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        return UploadSession.objects.get(id=response.data['data']['id'])
+
+    def put(self, session, offset, chunk):
+        return self.client.put(f'/api/uploads/{session.id}/', chunk, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {offset}-{offset + len(chunk) - 1}/{len(self.content)}')
+
+    def upload(self, session, chunk_size=20):
+        for offset in range(0, len(self.content), chunk_size):
+            self.assertEqual(self.put(session, offset, self.content[offset:offset + chunk_size]).status_code, 200)
+
+    def test_header_is_sniffed_from_short_reads(self):
+        session = SimpleNamespace(filename='photo.webp')
+        part = io.BytesIO()
+        self.assertEqual(write_chunk(session, part, TrickleStream(self.content), 0, len(self.content)), len(self.content))
+        self.assertEqual(part.getvalue(), self.content)
+
+        with self.assertRaises(ValidationError):
+            write_chunk(SimpleNamespace(filename='photo.png'), io.BytesIO(), TrickleStream(self.content), 0, 12)
+
+    def test_chunks_and_complete(self):
+        session = self.start()
+        self.assertEqual(self.put(session, 20, self.content[20:40]).status_code, 409)
+        self.upload(session)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/uploads/{session.id}/complete/', {'caption': 'uploaded'})
+        self.assertEqual(response.status_code, 201, response.data)
+
+        part = session.path
+        session.refresh_from_db()
+        self.assertEqual(session.status, COMPLETED)
+        self.assertFalse(default_storage.exists(part))
+        self.assertEqual(Post.objects.get(id=response.data['data']['post']).image.name, session.path)
+
+    def test_chunk_being_written_is_a_conflict(self):
+        session = self.start()
+        with locked_part(session):
+            response = self.put(session, 0, self.content[:20])
+            self.assertEqual(response.status_code, 409)
+            with self.assertRaises(ChunkConflict), locked_part(session):
+                pass
+        self.assertEqual(self.put(session, 0, self.content[:20]).status_code, 200)
+
+    def test_failed_attach_leaves_session_pending(self):
+        session = self.start()
+        self.upload(session)
+        with mock.patch.object(UploadSessionCompleteApiView, 'attach', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.client.post(f'/api/uploads/{session.id}/complete/', {'caption': 'uploaded'})
+
+        session.refresh_from_db()
+        self.assertEqual(session.status, PENDING)
+        self.assertTrue(default_storage.exists(session.path))
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual([name for _, _, names in os.walk(content_addressed_storage.path('blobs')) for name in names], [])
+
+        response = self.client.post(f'/api/uploads/{session.id}/complete/', {'caption': 'uploaded'})
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_abandoned_sessions_expire(self):
+        abandoned, active = self.start(), self.start()
+        UploadSession.objects.filter(id=abandoned.id).update(created_at=timezone.now() - timezone.timedelta(days=2))
+
+        self.assertEqual(expire_upload_sessions_task(), 1)
+        self.assertFalse(UploadSession.objects.filter(id=abandoned.id).exists())
+        self.assertFalse(default_storage.exists(abandoned.path))
+        self.assertTrue(default_storage.exists(active.path))
+        self.assertEqual(self.put(abandoned, 0, self.content[:20]).status_code, 404)
+
+
+class CachedCountTests(TestCase):
+
+    def test_viewers_share_the_cached_count(self):
+        viewer, other = (User.objects.create(username=name, auth_status=DONE) for name in ("viewer", "other"))
+        Post.objects.bulk_create([Post(author=viewer, caption="post", image="post-images/test.jpg") for _ in range(3)])
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        strategy = CachedCount()
+        self.assertEqual(strategy.count(Post.objects.with_viewer_state(viewer).filter(author=viewer)), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(strategy.count(Post.objects.with_viewer_state(other).filter(author=viewer)), 3)
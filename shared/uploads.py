@@ -0,0 +1,162 @@
+import os
+import posixpath
+import shutil
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File, locks
+from django.core.files.storage import default_storage
+from django.core.validators import FileExtensionValidator
+from rest_framework.exceptions import ValidationError
+
+from .models import POST_IMAGE, USER_PHOTO
+
+TARGET_FIELDS = {
+    POST_IMAGE: ('post.Post', 'image'),
+    USER_PHOTO: ('users.User', 'photo'),
+}
+
+# Leading bytes of every accepted format, mapped to the file extensions they are stored with
+SIGNATURES = (
+    (b'\xff\xd8\xff', ('jpg', 'jpeg')),
+    (b'\x89PNG\r\n\x1a\n', ('png',)),
+    (b'GIF87a', ('gif',)),
+    (b'GIF89a', ('gif',)),
+    (b'BM', ('bmp',)),
+    (b'II*\x00', ('tiff',)),
+    (b'MM\x00*', ('tiff',)),
+    (b'\x00\x00\x01\x00', ('ico',)),
+)
+HEIF_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1')
+# Bytes sniff_extensions() needs to tell every format apart (RIFF....WEBP, ....ftypheic)
+HEADER_SIZE = 12
+
+
+class ChunkConflict(Exception):
+    # The chunk does not continue the part file: answered with 409 and the session's state
+    pass
+
+
+def target_field(target):
+    model_label, field_name = TARGET_FIELDS[target]
+    return apps.get_model(model_label)._meta.get_field(field_name)
+
+
+def allowed_extensions(target):
+    for validator in target_field(target).validators:
+        if isinstance(validator, FileExtensionValidator):
+            return validator.allowed_extensions
+    return []
+
+
+def file_extension(filename):
+    return posixpath.splitext(filename)[1].lstrip('.').lower()
+
+
+def sniff_extensions(header):
+    for signature, extensions in SIGNATURES:
+        if header.startswith(signature):
+            return extensions
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return ('webp',)
+    if header[4:8] == b'ftyp' and header[8:12] in HEIF_BRANDS:
+        return ('heic', 'heif')
+    if header.lstrip()[:5] in (b'<?xml', b'<svg ', b'<svg>'):
+        return ('svg',)
+    return ()
+
+
+def check_header(session, header):
+    # Validate the real file type from the first bytes, before the rest of the upload is accepted
+    if file_extension(session.filename) not in sniff_extensions(header):
+        error = {
+            "success":False,
+            "message":"File content does not match an allowed image type."
+        }
+        raise ValidationError(error)
+
+
+def part_name(target, session_id):
+    return posixpath.join(target_field(target).upload_to, f"{session_id.hex}.part")
+
+
+def create_part_file(name):
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+@contextmanager
+def locked_part(session):
+    # The part file is locked while a chunk is written into it, not the session row: no transaction
+    # stays open while the chunk arrives. A concurrent chunk is turned away instead of waiting
+    with open(default_storage.path(session.path), 'r+b') as part:
+        if not locks.lock(part, locks.LOCK_EX | locks.LOCK_NB):
+            raise ChunkConflict("Another chunk of this upload is being written.")
+        try:
+            yield part
+        finally:
+            locks.unlock(part)
+
+
+def write_chunk(session, part, stream, offset, length):
+    # Copy the request body straight into the part file, one bounded block at a time
+    written = 0
+    part.seek(offset)
+    while written < length:
+        block = stream.read(min(settings.UPLOAD_READ_BLOCK_SIZE, length - written))
+        if not block:
+            break
+        if offset == 0 and written == 0:
+            # A read can return fewer bytes than the signatures are long
+            while len(block) < min(HEADER_SIZE, length):
+                more = stream.read(min(HEADER_SIZE, length) - len(block))
+                if not more:
+                    break
+                block += more
+            check_header(session, block)
+        part.write(block)
+        written += len(block)
+    return written
+
+
+class PartFile(File):
+    # Lets the field storage move the assembled part file instead of copying it
+    def temporary_file_path(self):
+        return self.name
+
+
+def finalize(session):
+    # Stores a hard link to the part file, which itself stays until the transaction that attaches the
+    # upload commits (discard() on commit): a rollback leaves the session pending on a complete part file
+    field = target_field(session.target)
+    path = default_storage.path(session.path)
+    link = f"{path}.final"
+    try:
+        os.link(path, link)
+    except FileExistsError:
+        os.remove(link)
+        os.link(path, link)
+    except OSError:
+        # No hard links on this file system
+        shutil.copyfile(path, link)
+    filename = posixpath.join(field.upload_to, f"{session.id.hex}.{file_extension(session.filename)}")
+    with open(link, 'rb') as handle:
+        name = field.storage.save(filename, PartFile(handle, name=link))
+    # Still there when the content was already stored
+    if os.path.exists(link):
+        os.remove(link)
+    return name
+
+
+def release(session, name):
+    # After a rolled back attach: the stored file, unless another field references the same content
+    field = target_field(session.target)
+    if hasattr(field.storage, 'remove_unreferenced'):
+        field.storage.remove_unreferenced(name)
+
+
+def discard(name):
+    if default_storage.exists(name):
+        default_storage.delete(name)
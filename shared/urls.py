@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import UploadSessionCreateApiView, UploadSessionApiView, UploadSessionCompleteApiView
+
+urlpatterns = [
+    path('', UploadSessionCreateApiView.as_view(), name="upload_create"),
+    path('<uuid:pk>/', UploadSessionApiView.as_view(), name="upload_chunk"),
+    path('<uuid:pk>/complete/', UploadSessionCompleteApiView.as_view(), name="upload_complete"),
+]
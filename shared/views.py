@@ -1,3 +1,165 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from post.models import Post
+from post.tasks import fan_out_post_task, process_post_image_task
+from users.models import User, PHOTO_STEP
+from users.tasks import process_user_photo_task
+from .models import UploadSession, POST_IMAGE, USER_PHOTO, PENDING, COMPLETED
+from .serializers import UploadSessionSerializer, UploadCompleteSerializer
+from .uploads import (
+    HEADER_SIZE, ChunkConflict, part_name, create_part_file, locked_part, write_chunk, finalize, release, discard,
+)
+
+
+class UploadSessionCreateApiView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        session = UploadSession(user=request.user, **serializer.validated_data)
+        session.path = part_name(session.target, session.id)
+        create_part_file(session.path)
+        session.save()
+
+        data = {
+            "success":True,
+            "message":"Upload session created.",
+            "chunk_size":settings.UPLOAD_CHUNK_SIZE,
+            "data":UploadSessionSerializer(session).data
+        }
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionApiView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        session = get_object_or_404(UploadSession, id=pk, user=request.user)
+        return Response({"success":True, "data":UploadSessionSerializer(session).data})
+
+    def put(self, request, pk):
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        offset = self.get_offset(request)
+        session = get_object_or_404(UploadSession, id=pk, user=request.user)
+
+        try:
+            with locked_part(session) as part:
+                # Read again under the file lock: the chunk before this one may just have been written
+                session.refresh_from_db(fields=['status', 'received_size'])
+                self.check_chunk(session, offset, length)
+                try:
+                    written = write_chunk(session, part, request.stream, offset, length)
+                except ValidationError as error:
+                    rejected = error
+                else:
+                    rejected = None
+                    # One UPDATE advances the offset, conditional on the state checked above
+                    UploadSession.objects.filter(id=session.id, status=PENDING, received_size=offset).update(
+                        received_size=offset + written, updated_at=timezone.now()
+                    )
+                    session.received_size += written
+        except ChunkConflict as conflict:
+            data = {
+                "success":False,
+                "message":str(conflict),
+                "data":UploadSessionSerializer(session).data
+            }
+            return Response(data, status=status.HTTP_409_CONFLICT)
+        except (FileNotFoundError, UploadSession.DoesNotExist):
+            # Expired and removed by expire_upload_sessions_task
+            raise NotFound()
+
+        if rejected is not None:
+            # Content is not an allowed image: the session can't be resumed
+            discard(session.path)
+            session.delete()
+            raise rejected
+
+        return Response({"success":True, "data":UploadSessionSerializer(session).data})
+
+    @staticmethod
+    def check_chunk(session, offset, length):
+        if session.status != PENDING:
+            raise ValidationError({"success":False, "message":"Upload is already completed."})
+        if offset != session.received_size:
+            raise ChunkConflict("Chunk offset does not match the received size.")
+        if length <= 0 or offset + length > session.total_size:
+            raise ValidationError({"success":False, "message":"Chunk exceeds the declared file size."})
+        if offset == 0 and length < min(HEADER_SIZE, session.total_size):
+            raise ValidationError({"success":False, "message":"The first chunk is too short to check the file type."})
+
+    @staticmethod
+    def get_offset(request):
+        # Content-Range: bytes <start>-<end>/<total>, or ?offset=<start>
+        content_range = request.META.get('HTTP_CONTENT_RANGE', '')
+        try:
+            if content_range.startswith('bytes '):
+                return int(content_range[len('bytes '):].split('-', 1)[0])
+            return int(request.query_params.get('offset', 0))
+        except ValueError:
+            raise ValidationError({"success":False, "message":"Invalid chunk offset."})
+
+
+class UploadSessionCompleteApiView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        with transaction.atomic():
+            session = get_object_or_404(UploadSession.objects.select_for_update(), id=pk, user=request.user)
+            if session.status != PENDING or session.received_size != session.total_size:
+                data = {
+                    "success":False,
+                    "message":"Upload is not complete.",
+                    "data":UploadSessionSerializer(session).data
+                }
+                return Response(data, status=status.HTTP_409_CONFLICT)
+
+            serializer = UploadCompleteSerializer(data=request.data, context={'session': session})
+            serializer.is_valid(raise_exception=True)
+
+            part, name = session.path, None
+            try:
+                with transaction.atomic():
+                    name = finalize(session)
+                    session.path = name
+                    session.status = COMPLETED
+                    session.save(update_fields=['path', 'status', 'updated_at'])
+                    data = self.attach(session, name, serializer.validated_data)
+            except Exception:
+                # The session stays pending on its part file and can be completed again
+                if name is not None:
+                    release(session, name)
+                raise
+            transaction.on_commit(lambda: discard(part))
+
+        return Response({"success":True, "message":"Upload successfully completed.", "data":data},
+                        status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def attach(session, name, validated_data):
+        if session.target == POST_IMAGE:
+            post = Post.objects.create(author=session.user, caption=validated_data['caption'], image=name)
+            transaction.on_commit(lambda: process_post_image_task.delay(post.id))
+            transaction.on_commit(lambda: fan_out_post_task.delay(post.id))
+            return {"post": post.id}
+
+        if session.target == USER_PHOTO:
+            user = User.objects.get(id=session.user_id)
+            previous_photo = user.photo.name
+            user.photo = name
+            user.auth_status = PHOTO_STEP
+            user.save()
+            if previous_photo:
+                user.photo.storage.delete(previous_photo)
+            transaction.on_commit(lambda: process_user_photo_task.delay(user.id))
+            return {"photo": user.photo.url}
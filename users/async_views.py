@@ -0,0 +1,27 @@
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from post.async_views import AsyncAPIView
+from .serializers import LoginSerializers
+
+# Async counterparts of views in users.views, served instead of them when ASYNC_VIEWS is on (see config/asgi.py)
+
+
+class LoginView(AsyncAPIView):
+    # Under ASGI the sync LoginView hashes in the one thread that runs every sync view, so each
+    # login holds up the others; this one hashes on users.hashers' threads
+    authentication_class = None
+    authentication_required = False
+    serializer_class = LoginSerializers
+    http_method_names = ['post']
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data, context={'request': request, 'view': self})
+        try:
+            attrs = serializer.to_internal_value(request.data)
+            await serializer.aauth_validate(attrs)
+        except ValidationError as exc:
+            # The body serializer.is_valid() would have given
+            raise ValidationError(as_serializer_error(exc))
+        return self.respond(await sync_to_async(serializer.login_data)())
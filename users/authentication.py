@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+from .tokens import USER_CLAIMS, REFRESH_JTI_CLAIM, blacklisted_tokens
+
+
+class AuthStateCache:
+    # user id -> the fields that decide whether a token is still good, or None for a deleted user.
+    # Per process for AUTH_STATE_CACHE_TTL seconds; saves in this process drop the entry
+    # (users/signals.py), other processes pick the change up when it expires
+    fields = ('is_active', 'auth_status', 'user_roles')
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        found, state = self.cached(user_id)
+        if not found:
+            state = User.objects.filter(id=user_id).values(*self.fields).first()
+            self.store(user_id, state)
+        return state
+
+    async def aget(self, user_id):
+        found, state = self.cached(user_id)
+        if not found:
+            state = await User.objects.filter(id=user_id).values(*self.fields).afirst()
+            self.store(user_id, state)
+        return state
+
+    def cached(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(user_id)
+                return True, entry[1]
+        return False, None
+
+    def store(self, user_id, state):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + settings.AUTH_STATE_CACHE_TTL, state)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.AUTH_STATE_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+auth_states = AuthStateCache()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    # Only for views that read no more of request.user than id, username, is_active, auth_status and
+    # user_roles (post/tests.py ClaimsAuthenticationTests): request.user is built from the token claims
+    # and the cached auth state instead of a SELECT of the whole row per request. Any other field is
+    # deferred and would cost that query after all. Tokens issued without the claims get the regular
+    # full load. Access tokens of a logged out (blacklisted) refresh token are refused
+
+    def get_user(self, validated_token):
+        if not self.has_claims(validated_token):
+            return super(ClaimsJWTAuthentication, self).get_user(validated_token)
+
+        if validated_token[REFRESH_JTI_CLAIM] in blacklisted_tokens:
+            raise AuthenticationFailed(_("Token is blacklisted"), code="token_blacklisted")
+        user_id = self.get_user_id(validated_token)
+        return self.claims_user(validated_token, user_id, auth_states.get(user_id))
+
+    @staticmethod
+    def has_claims(validated_token):
+        # The password hash check of CHECK_REVOKE_TOKEN needs the row
+        return not api_settings.CHECK_REVOKE_TOKEN and all(
+            claim in validated_token for claim in (*USER_CLAIMS, REFRESH_JTI_CLAIM)
+        )
+
+    @staticmethod
+    def get_user_id(validated_token):
+        try:
+            return str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    @staticmethod
+    def claims_user(validated_token, user_id, state):
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not state['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        # The cached state wins over the claims, which are as old as the token
+        loaded = {'id': User._meta.pk.to_python(user_id), 'username': validated_token['username'], **state}
+        return User.from_db(DEFAULT_DB_ALIAS, list(loaded), [
+            loaded[field.attname] for field in User._meta.concrete_fields if field.attname in loaded
+        ])
+
+
+class AsyncClaimsJWTAuthentication(ClaimsJWTAuthentication):
+    # ClaimsJWTAuthentication for the async views: header parsing and signature checks only use the
+    # CPU, the blacklist, the auth state and full loads are read without blocking the event loop
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if not self.has_claims(validated_token):
+            return await self.aload_user(validated_token)
+
+        if await blacklisted_tokens.acontains(validated_token[REFRESH_JTI_CLAIM]):
+            raise AuthenticationFailed(_("Token is blacklisted"), code="token_blacklisted")
+        user_id = self.get_user_id(validated_token)
+        return self.claims_user(validated_token, user_id, await auth_states.aget(user_id))
+
+    async def aload_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
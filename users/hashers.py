@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# The hashers of PASSWORD_HASHERS with their work factors read from the settings. The algorithm
+# names are Django's, so existing hashes keep verifying; a hash made with another hasher or other
+# work factors than the first one's is upgraded by check_password() on the next successful login.
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    # scrypt uses 128 * n * r bytes and OpenSSL refuses more than 32 MiB by default, which already
+    # fails at n = 2 ** 15. Only a limit: stored hashes with a higher work factor must still verify
+    maxmem = 2 ** 30
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    # Needs argon2-cffi
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+def verify_password(user, password):
+    # Unknown users cost a hash too, so response times do not tell which accounts exist
+    if user is None:
+        hashers.make_password(password)
+        return False
+    return user.check_password(password)
+
+
+# Hashing only uses the CPU and releases the GIL: async views run it on these threads instead of
+# the event loop, or the one thread that the sync views and the async ORM share under ASGI
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_THREADS or os.cpu_count(),
+                               thread_name_prefix='password-hashing')
+
+
+def run_hasher(func):
+    return sync_to_async(func, thread_sensitive=False, executor=_executor)
+
+
+async def averify_password(user, password):
+    if user is None:
+        await run_hasher(hashers.make_password)(password)
+        return False
+
+    is_correct, must_update = await run_hasher(hashers.verify_password)(password, user.password)
+    if is_correct and must_update:
+        user.password = await run_hasher(hashers.make_password)(password)
+        await user.asave(update_fields=['password'])
+    return is_correct
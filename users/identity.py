@@ -0,0 +1,26 @@
+import re
+
+from shared.utility import check_user_type, email_regex
+from .models import User
+
+EMAIL, PHONE, USERNAME = ('email', 'phone', 'username')
+
+# Each kind of identifier is looked up on its own unique index; email__iexact compiles to
+# UPPER("email") = UPPER(%s) on PostgreSQL, served by the users_user_email_upper_uniq constraint's index
+LOOKUPS = {
+    EMAIL: 'email__iexact',
+    PHONE: 'phone',
+    USERNAME: 'username',
+}
+
+
+def email_or_phone_type(value):
+    # Any phone number that signup accepted, not only the ones check_user_type() recognises
+    return EMAIL if re.fullmatch(email_regex, value) else PHONE
+
+
+def resolve_user(user_input, input_type=None):
+    # Classifies the input once (check_user_type() unless given) and loads the user with one query.
+    # Returns (input_type, user or None)
+    input_type = input_type or check_user_type(user_input)
+    return input_type, User.objects.filter(**{LOOKUPS[input_type]: user_input}).first()
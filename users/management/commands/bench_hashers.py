@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from users.models import User, DONE
+from users.views import LoginView
+
+
+class Command(BaseCommand):
+    help = "Benchmark LoginView with each password hasher at its configured work factors: login p50/p99 " \
+           "and CPU seconds per login, against a seeded user (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50)
+        parser.add_argument('--hasher', action='append', dest='hashers', default=[],
+                            help="Dotted path of a hasher, repeat to compare several (default: PASSWORD_HASHERS).")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = LoginView.as_view()
+        self.stdout.write(f"{'hasher':<40} {'logins':>7} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms':>8}")
+        for path in options['hashers'] or settings.PASSWORD_HASHERS:
+            with override_settings(PASSWORD_HASHERS=[path]):
+                try:
+                    get_hasher().encode("warm up", get_hasher().salt())
+                except (ValueError, ImportError) as exc:
+                    self.stdout.write(f"{path:<40} skipped: {exc}")
+                    continue
+
+                with transaction.atomic():
+                    User.objects.create(username="bench_hashers", password="bench-password", auth_status=DONE)
+                    timings = []
+                    cpu_started = time.process_time()
+                    for _ in range(options['logins']):
+                        request = factory.post('/api/users/login/', {'userinput': "bench_hashers",
+                                                                     'password': "bench-password"}, format='json')
+                        started = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        timings.append((time.perf_counter() - started) * 1000)
+                        assert response.status_code == 200, response.content
+                    cpu = (time.process_time() - cpu_started) * 1000 / options['logins']
+                    transaction.set_rollback(True)
+
+            self.stdout.write(f"{path:<40} {len(timings):>7} {self.p(timings, 50):>8.1f} "
+                              f"{self.p(timings, 99):>8.1f} {cpu:>8.1f}")
+
+    @staticmethod
+    def p(timings, percentile):
+        if len(timings) < 2:
+            return timings[0]
+        return statistics.quantiles(timings, n=100)[percentile - 1]
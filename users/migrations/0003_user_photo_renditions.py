@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_followers_count_user_following_count_follow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='photo_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
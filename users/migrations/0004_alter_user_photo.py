@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:49
+
+import django.core.validators
+import shared.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_photo_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=shared.storage.media_storage, upload_to='profile-photos/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'heic', 'heif', 'webp', 'svg'])]),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_user_photo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userconfirmation',
+            index=models.Index(condition=models.Q(('is_confirmed', False)), fields=['user', 'expiration_time'], name='verify_codes_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:02
+
+import shared.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='follow',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='userconfirmation',
+            name='id',
+            field=models.UUIDField(default=shared.ids.uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:28
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0007_email_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('email'), name='users_user_email_upper_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_user_email_upper_idx',
+        ),
+    ]
@@ -2,12 +2,16 @@ import random
 import uuid
 from datetime import datetime , timedelta
 
+from django.contrib.auth.hashers import identify_hasher
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import FileExtensionValidator
-from django.db import models
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.db import models, transaction
+from django.db.models import F, Q, UniqueConstraint, CheckConstraint
+from django.db.models.functions import Greatest, Upper
 
 from shared.models import BaseModel
+from shared.storage import media_storage
+from .tokens import issue_tokens
 
 # Create your models here.
 ORDINARY, MANAGER , ADMIN = ('ordinary', 'manager', 'admin')
@@ -35,7 +39,18 @@ class User(AbstractUser , BaseModel):
     auth_status = models.CharField(max_length=32 , choices=AUTH_STATUS , default=NEW)
     email = models.EmailField(null=True , blank=True , unique=True)
     phone = models.CharField(max_length=13 , null=True , blank=True , unique=True)
-    photo = models.ImageField(upload_to='profile-photos/' , null=True , blank=True , validators=[FileExtensionValidator(allowed_extensions=['jpg' , 'jpeg' , 'png' , 'heic' ,'heif' , 'webp' ,'svg'])])
+    photo = models.ImageField(upload_to='profile-photos/' , storage=media_storage , null=True , blank=True , validators=[FileExtensionValidator(allowed_extensions=['jpg' , 'jpeg' , 'png' , 'heic' ,'heif' , 'webp' ,'svg'])])
+    photo_renditions = models.JSONField(default=dict, blank=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Emails are unique whatever their case. Login and forget password look them up with
+            # email__iexact (users/identity.py), which compiles to UPPER("email") = UPPER(%s) and is
+            # served by this constraint's index, not by the case-sensitive unique index on email
+            UniqueConstraint(Upper('email'), name='users_user_email_upper_uniq'),
+        ]
 
     def __str__(self):
         return self.username
@@ -71,15 +86,15 @@ class User(AbstractUser , BaseModel):
             self.password = temp_password
 
     def hashing_password(self):
-        if not self.password.startswith('pbkdf2_sha256'):
+        # A raw password assigned to the field; hashes of any configured hasher are kept as they are
+        try:
+            identify_hasher(self.password)
+        except ValueError:
             self.set_password(self.password)
 
-    def token(self):
-        refresh = RefreshToken.for_user(self)
-        return {
-            "access":str(refresh.access_token),
-            "refresh_token":str(refresh)
-        }
+    def token(self, endpoint="other"):
+        # A new refresh/access pair on every call: call it once per response
+        return issue_tokens(self, endpoint)
     def clean(self):
         self.check_email()
         self.check_username()
@@ -90,6 +105,23 @@ class User(AbstractUser , BaseModel):
         self.clean()
         super(User, self).save(*args , **kwargs)
 
+    def follow(self, author):
+        with transaction.atomic():
+            follow, created = Follow.objects.get_or_create(follower=self, following=author)
+            if created:
+                User.objects.filter(id=self.id).update(following_count=F('following_count') + 1)
+                User.objects.filter(id=author.id).update(followers_count=F('followers_count') + 1)
+        return created
+
+    def unfollow(self, author):
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(follower=self, following=author).delete()
+            if deleted:
+                # Greatest(): a counter that drifted below the real count must not fail the CHECK constraint
+                User.objects.filter(id=self.id).update(following_count=Greatest(F('following_count') - deleted, 0))
+                User.objects.filter(id=author.id).update(followers_count=Greatest(F('followers_count') - deleted, 0))
+        return bool(deleted)
+
 
 PHONE_EXPIRE = 2
 EMAIL_EXPIRE = 2
@@ -104,6 +136,13 @@ class UserConfirmation(BaseModel):
     expiration_time = models.DateTimeField(null=True , blank=True)
     is_confirmed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Unused codes of a user that have not expired yet (VerifyApiView, GetNewVerification)
+            models.Index(fields=['user', 'expiration_time'], name='verify_codes_pending_idx',
+                         condition=Q(is_confirmed=False)),
+        ]
+
     def __str__(self):
         return str(self.user.__str__())
 
@@ -112,4 +151,21 @@ class UserConfirmation(BaseModel):
             self.expiration_time = datetime.now() + timedelta(minutes=EMAIL_EXPIRE)
         else:
             self.expiration_time = datetime.now() + timedelta(minutes=PHONE_EXPIRE)
-        super(UserConfirmation , self).save(*args , **kwargs)
\ No newline at end of file
+        super(UserConfirmation , self).save(*args , **kwargs)
+
+
+class Follow(BaseModel):
+    follower = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='following')
+    following = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='followers')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['follower', 'following'], name='unique_follow'),
+            CheckConstraint(condition=~Q(follower=F('following')), name='prevent_self_follow'),
+        ]
+        db_table = "user_follows"
+        verbose_name = "follow"
+        verbose_name_plural = "follows"
+
+    def __str__(self):
+        return f'{self.follower} follows {self.following}'
@@ -1,27 +1,40 @@
 from typing import Dict, Any
 
-from django.contrib.auth import authenticate
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import update_last_login
 from django.contrib.auth.password_validation import validate_password
-from django.db.models import Q
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import AccessToken
 
+from .hashers import verify_password, averify_password
+from .identity import USERNAME, email_or_phone_type, resolve_user
 from .models import User, VIA_EMAIL, VIA_PHONE, NEW, CODE_VERIFIED, DONE, PHOTO_STEP
-from .tasks import send_email_task, send_phone_task
+from .tasks import process_user_photo_task
+from .tokens import UserRefreshToken
 from rest_framework.validators import ValidationError
-from shared.utility import check_email_or_phone, check_user_type
+from shared.cache import MemoizedRepresentationMixin, VersionedRepresentationCache
+from shared.images import rendition_urls
+from shared.utility import check_email_or_phone, send_email, send_phone
 from django.core.validators import FileExtensionValidator
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MemoizedRepresentationMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    photo_renditions = serializers.SerializerMethodField('get_photo_renditions')
+
+    # Keyed by updated_at, which every User.save() bumps
+    memo = VersionedRepresentationCache('user')
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'photo')
+        fields = ('id', 'username', 'photo', 'photo_renditions')
+
+    def get_photo_renditions(self, obj):
+        return rendition_urls(obj.photo.storage, obj.photo_renditions, self.context.get('request'))
 
 
 class SignUpSerializers(serializers.ModelSerializer):
@@ -52,10 +65,10 @@ class SignUpSerializers(serializers.ModelSerializer):
         user = super(SignUpSerializers, self).create(validated_data)
         if user.auth_type == VIA_EMAIL:
             code = user.create_verify_code(VIA_EMAIL)
-            send_email_task.delay(user.email, code)
+            send_email(user.email, code)
         elif user.auth_type == VIA_PHONE:
             code = user.create_verify_code(VIA_PHONE)
-            send_phone_task.delay(user.phone, code)
+            send_phone(user.phone, code)
         user.save()
 
         return user
@@ -93,7 +106,7 @@ class SignUpSerializers(serializers.ModelSerializer):
 
     def validate_email_phone_number(self, value):
         value = value.lower()
-        if value and User.objects.filter(email=value).exists():
+        if value and User.objects.filter(email__iexact=value).exists():
             data = {
                 "success":False,
                 "message":"Email already use."
@@ -110,7 +123,7 @@ class SignUpSerializers(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super(SignUpSerializers, self).to_representation(instance)
-        data.update(instance.token())
+        data.update(instance.token("signup"))
 
         return data
 
@@ -217,9 +230,13 @@ class ChangeUserPhotoSerializers(serializers.Serializer):
     def update(self, instance, validated_data):
         photo = validated_data.get('photo')
         if photo:
+            previous_photo = instance.photo.name
             instance.photo = photo
             instance.auth_status = PHOTO_STEP
             instance.save()
+            if previous_photo:
+                instance.photo.storage.delete(previous_photo)
+            transaction.on_commit(lambda: process_user_photo_task.delay(instance.id))
         return instance
 
 class LoginSerializers(TokenObtainPairSerializer):
@@ -230,40 +247,39 @@ class LoginSerializers(TokenObtainPairSerializer):
         self.fields['username'] = serializers.CharField(required=False, read_only=True)
 
     def auth_validate(self, data):
-        user_input = data.get('userinput')
-        if check_user_type(user_input) == "username":
-            username  = user_input
-        elif check_user_type(user_input) == "email":
-            user = self.get_user(email__iexact=user_input)
-            username = user.username
-        elif check_user_type(user_input) == "phone":
-            # Telefon raqami bo'yicha foydalanuvchini tekshirish
-            user = self.get_user(phone=user_input)
-            username = user.username  # Telefon raqami bilan username olish
-        else:
+        user = self.get_login_user(data.get('userinput'))
+        self.check_registration(user)
+        self.check_credentials(user, verify_password(user, data["password"]))
+
+    async def aauth_validate(self, data):
+        # The query in the ORM's thread, the hashing in the hashers' threads
+        user = await sync_to_async(self.get_login_user)(data.get('userinput'))
+        self.check_registration(user)
+        self.check_credentials(user, await averify_password(user, data["password"]))
+
+    def get_login_user(self, user_input):
+        # The account is loaded once, verify_password() checks the password against it
+        input_type, user = resolve_user(user_input)
+        if user is None and input_type != USERNAME:
             error = {
                 "success": False,
-                "message": "You need to enter email, phone number, or username."
+                "message": "No active account found."
             }
             raise ValidationError(error)
+        return user
 
-        authentication_kwargs = {
-            self.username_field: username,
-            "password": data["password"]
-        }
-
+    @staticmethod
+    def check_registration(user):
         # Foydalanuvchini tekshirish
-        current_user = User.objects.filter(username__exact=username).first()
-        if current_user is not None and current_user.auth_status in [NEW, CODE_VERIFIED]:
+        if user is not None and user.auth_status in [NEW, CODE_VERIFIED]:
             error = {
                 "success": False,
                 "message": "You are not fully registered."
             }
             raise ValidationError(error)
 
-        user = authenticate(**authentication_kwargs)
-
-        if user is not None:
+    def check_credentials(self, user, password_correct):
+        if password_correct and user.is_active:
             self.user = user
         else:
             error = {
@@ -274,27 +290,21 @@ class LoginSerializers(TokenObtainPairSerializer):
 
     def validate(self, data):
         self.auth_validate(data)
+        return self.login_data()
+
+    def login_data(self):
         if self.user.auth_status not in [DONE, PHOTO_STEP]:
             raise PermissionDenied("You cannot login! You don't have permission.")
 
-        data = self.user.token()
+        data = self.user.token("login")
         data["auth_status"] = self.user.auth_status
         data["full_name"] = self.user.full_name
 
         return data
 
-    def get_user(self, **kwargs):
-        users = User.objects.filter(**kwargs)
-        if not users.exists():
-            error = {
-                "success": False,
-                "message": "No active account found."
-            }
-            raise ValidationError(error)
-
-        return users.first()
-
 class LoginRefreshSerializer(TokenRefreshSerializer):
+    # Checked against the in-process blacklist cache
+    token_class = UserRefreshToken
 
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -323,10 +333,11 @@ class ForgetPasswordSerializer(serializers.Serializer):
 
             raise ValidationError(error)
 
-        user = User.objects.filter(Q(phone=email_or_phone) | Q(email=email_or_phone))
-        if not user.exists():
+        input_type, user = resolve_user(email_or_phone, email_or_phone_type(email_or_phone))
+        if user is None:
             raise NotFound(detail="User Not Found.")
-        attrs['user'] = user.first()
+        attrs['user'] = user
+        attrs['input_type'] = input_type
 
         return attrs
 
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shared.images import delete_renditions
+from .authentication import auth_states
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_auth_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: auth_states.invalidate(instance.id))
+
+
+@receiver(post_delete, sender=User)
+def release_user_photo(sender, instance, **kwargs):
+    # Also for users deleted in the admin: the blob references of the photo and its renditions
+    if instance.photo:
+        instance.photo.storage.delete(instance.photo.name)
+    delete_renditions(instance.photo.storage, instance.photo_renditions)
@@ -1,20 +1,50 @@
 from celery import shared_task
-from shared.utility import send_email , send_phone
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from shared.images import build_renditions, delete_renditions
+from shared.notifications import EMAIL, SMS, deliver, verification_code_message
+from .models import User
 
+# Superseded by shared.notifications; kept for messages queued before it
 @shared_task
 def send_email_task(email, code):
-    send_email(email, code)
+    deliver(verification_code_message(EMAIL, email, code))
 
 @shared_task
 def send_phone_task(phone, code):
-    send_phone(phone, code)
-from celery import shared_task
-from shared.utility import send_email , send_phone
+    deliver(verification_code_message(SMS, phone, code))
 
 @shared_task
-def send_email_task(email, code):
-    send_email(email, code)
+def process_user_photo_task(user_id):
+    user = User.objects.filter(id=user_id).first()
+    if user is None or not user.photo:
+        return
+
+    renditions = build_renditions(user.photo)
+    # queryset update: User.save() would run clean(). updated_at is bumped so memoized
+    # UserSerializer representations pick up the renditions
+    updated = User.objects.filter(id=user.id, photo=user.photo.name).update(
+        photo_renditions=renditions, updated_at=timezone.now()
+    )
+    if updated:
+        delete_renditions(user.photo.storage, user.photo_renditions)
+    else:
+        delete_renditions(user.photo.storage, renditions)
+
 
 @shared_task
-def send_phone_task(phone, code):
-    send_phone(phone, code)
+def prune_expired_tokens_task():
+    # Expired refresh tokens can neither be used nor need blacklisting: their outstanding rows go
+    # in batches, with their blacklist rows (CASCADE). Walks the primary key, old ids expire first
+    expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now()).order_by('id')
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(expired.filter(id__gt=last_id).values_list('id', flat=True)[:settings.TOKEN_PRUNE_BATCH_SIZE])
+        if not ids:
+            break
+        _, per_model = OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += per_model.get(OutstandingToken._meta.label, 0)
+        last_id = ids[-1]
+    return deleted
@@ -1,3 +1,160 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from users.models import User, NEW, DONE, VIA_EMAIL
+from users.tasks import prune_expired_tokens_task
+from users.tokens import UserRefreshToken, blacklisted_tokens, issue_tokens
+
+
+class TokenMintingTests(APITestCase):
+    # One token pair per response, recorded with one INSERT
+
+    password = "check-token-minting"
+
+    @staticmethod
+    def minted(endpoint):
+        return REGISTRY.get_sample_value('auth_tokens_minted_total', {'endpoint': endpoint}) or 0
+
+    def assertMintedOnce(self, endpoint, call):
+        minted = self.minted(endpoint)
+        with CaptureQueriesContext(connection) as queries:
+            response = call()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.minted(endpoint) - minted, 1)
+        inserts = [query for query in queries
+                   if query['sql'].startswith(f'INSERT INTO "{OutstandingToken._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_login(self):
+        User.objects.create(username="check_login", password=self.password, auth_status=DONE)
+        self.assertMintedOnce('login', lambda: self.client.post(
+            '/api/users/login/', {'userinput': "check_login", 'password': self.password}
+        ))
+
+    def test_verify(self):
+        user = User.objects.create(username="check_verify", email="check_verify@example.com",
+                                   auth_type=VIA_EMAIL, auth_status=NEW)
+        code = user.create_verify_code(VIA_EMAIL)
+        self.client.force_authenticate(user)
+        self.assertMintedOnce('verify', lambda: self.client.post('/api/users/verify/', {'code': code}))
+
+
+class IdentityQueryCountTests(APITestCase):
+    # Login and forget password resolve the user with one query, whichever identifier was entered
+
+    password = "check-identity-queries"
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(username="check_identity", email="check_identity@example.com", phone="+998911234567",
+                            password=cls.password, auth_status=DONE)
+
+    def assertOneUserQuery(self, url, data, queries):
+        with self.assertNumQueries(queries) as captured:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        selects = [query for query in captured.captured_queries
+                   if query['sql'].startswith('SELECT') and f'FROM "{User._meta.db_table}"' in query['sql']]
+        self.assertEqual(len(selects), 1)
+
+    def test_login_by_username(self):
+        self.assertOneUserQuery('/api/users/login/', {'userinput': "check_identity", 'password': self.password}, 2)
+
+    def test_login_by_email(self):
+        self.assertOneUserQuery('/api/users/login/',
+                                {'userinput': "Check_Identity@Example.com", 'password': self.password}, 2)
+
+    def test_login_by_phone(self):
+        self.assertOneUserQuery('/api/users/login/', {'userinput': "+998911234567", 'password': self.password}, 2)
+
+    def test_forget_password_by_email(self):
+        self.assertOneUserQuery('/api/users/forget/password/', {'email_or_phone': "check_identity@example.com"}, 3)
+
+    def test_forget_password_by_phone(self):
+        self.assertOneUserQuery('/api/users/forget/password/', {'email_or_phone': "+998911234567"}, 3)
+
+
+class EmailUniquenessTests(APITestCase):
+
+    def test_emails_differing_by_case_are_rejected(self):
+        User.objects.create(username="first", email="same@example.com")
+        # bulk_create() skips User.save(), which lowercases emails
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.bulk_create([User(username="second", email="SAME@example.com", password="x")])
+
+
+class FollowCountTests(APITestCase):
+
+    def test_unfollow_never_goes_below_zero(self):
+        follower = User.objects.create(username="follower", auth_status=DONE)
+        author = User.objects.create(username="author", auth_status=DONE)
+        self.assertTrue(follower.follow(author))
+        # Counters that drifted below the real count
+        User.objects.filter(id__in=[follower.id, author.id]).update(following_count=0, followers_count=0)
+
+        self.assertTrue(follower.unfollow(author))
+        self.assertFalse(follower.unfollow(author))
+        self.assertEqual(User.objects.get(id=follower.id).following_count, 0)
+        self.assertEqual(User.objects.get(id=author.id).followers_count, 0)
+
+
+class TokenBlacklistTests(APITestCase):
+    # Logout blacklists the refresh token; the per-process cache and the pruning task keep up
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="check_blacklist", auth_status=DONE)
+
+    def setUp(self):
+        # The cache outlives the test's transaction
+        blacklisted_tokens.clear()
+        self.addCleanup(blacklisted_tokens.clear)
+        self.client.force_authenticate(self.user)
+
+    def logout(self, refresh):
+        return self.client.post('/api/users/logout/', {'refresh': refresh})
+
+    def test_logout(self):
+        refresh = issue_tokens(self.user, 'login')["refresh_token"]
+        self.assertEqual(self.logout(refresh).status_code, 205)
+        self.assertIn(UserRefreshToken(refresh, verify=False)['jti'], blacklisted_tokens)
+
+        # Already blacklisted and malformed tokens are rejected, not a server error
+        self.assertEqual(self.logout(refresh).status_code, 400)
+        self.assertEqual(self.logout("not-a-token").status_code, 400)
+
+    @override_settings(BLACKLIST_CACHE_REFRESH=0)
+    def test_cache_reads_other_processes(self):
+        fresh, expired = (
+            OutstandingToken.objects.create(user=self.user, jti=jti, token=jti, expires_at=timezone.now() + delta)
+            for jti, delta in (("fresh", timedelta(hours=1)), ("expired", -timedelta(hours=1)))
+        )
+        self.assertNotIn("fresh", blacklisted_tokens)
+
+        # Rows blacklisted elsewhere show up on the next refresh; expired ones are left out
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=fresh), BlacklistedToken(token=expired)])
+        self.assertIn("fresh", blacklisted_tokens)
+        self.assertNotIn("expired", blacklisted_tokens)
+
+    @override_settings(TOKEN_PRUNE_BATCH_SIZE=2)
+    def test_prune_expired_tokens(self):
+        now = timezone.now()
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=self.user, jti=f"token-{i}", token=f"token-{i}",
+                             expires_at=now + timedelta(hours=1 if i % 2 else -1))
+            for i in range(6)
+        ])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens[:2]])
+
+        self.assertEqual(prune_expired_tokens_task(), 3)
+        self.assertEqual(
+            set(OutstandingToken.objects.values_list('jti', flat=True)), {"token-1", "token-3", "token-5"}
+        )
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ["token-1"])
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from shared.metrics import TOKENS_MINTED
+
+# User fields copied into the tokens, so that ClaimsJWTAuthentication can build request.user
+# without loading the row. Access tokens issued by refresh carry the refresh token's copies
+USER_CLAIMS = ('username', 'auth_status', 'user_roles')
+
+# JTI of the refresh token an access token was minted from: ClaimsJWTAuthentication rejects access
+# tokens whose refresh token was blacklisted (logout)
+REFRESH_JTI_CLAIM = 'refresh_jti'
+
+
+class BlacklistCache:
+    # JTI -> expiry of the blacklisted refresh tokens, per process. Refreshed at most every
+    # BLACKLIST_CACHE_REFRESH seconds with the rows past a watermark on the id; the watermark only
+    # moves to ids that were seen BLACKLIST_CACHE_OVERLAP seconds ago, so rows that committed out
+    # of id order are still read
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __contains__(self, jti):
+        if self.stale():
+            self.refresh()
+        return jti in self.expiries
+
+    async def acontains(self, jti):
+        if self.stale():
+            await sync_to_async(self.refresh)()
+        return jti in self.expiries
+
+    def stale(self):
+        return time.monotonic() - self.refreshed > settings.BLACKLIST_CACHE_REFRESH
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.expiries[jti] = expires_at
+
+    def refresh(self):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        with self.lock:
+            now = time.monotonic()
+            if now - self.refreshed <= settings.BLACKLIST_CACHE_REFRESH:
+                return
+
+            rows = BlacklistedToken.objects.filter(id__gt=self.watermark, token__expires_at__gt=timezone.now())
+            for row_id, jti, expires_at in rows.values_list('id', 'token__jti', 'token__expires_at'):
+                self.expiries[jti] = expires_at
+                self.last_id = max(self.last_id, row_id)
+
+            self.marks.append((now, self.last_id))
+            while self.marks and now - self.marks[0][0] >= settings.BLACKLIST_CACHE_OVERLAP:
+                self.watermark = self.marks.pop(0)[1]
+
+            if now - self.purged >= settings.BLACKLIST_CACHE_OVERLAP:
+                # Expired tokens fail their exp check anyway
+                current = timezone.now()
+                self.expiries = {jti: expires_at for jti, expires_at in self.expiries.items() if expires_at > current}
+                self.purged = now
+            self.refreshed = now
+
+    def clear(self):
+        self.expiries = {}
+        self.marks = []
+        self.watermark = self.last_id = 0
+        self.refreshed = self.purged = float('-inf')
+
+
+blacklisted_tokens = BlacklistCache()
+
+
+class UserRefreshToken(RefreshToken):
+
+    @classmethod
+    def for_user(cls, user):
+        # Token.for_user, past BlacklistMixin.for_user and its OutstandingToken INSERT:
+        # issue_tokens() records the tokens it mints in bulk
+        token = super(BlacklistMixin, cls).for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+    @property
+    def access_token(self):
+        access = super(UserRefreshToken, self).access_token
+        access[REFRESH_JTI_CLAIM] = self.payload[api_settings.JTI_CLAIM]
+        return access
+
+    def check_blacklist(self):
+        # The in-process blacklist instead of a query per refresh; a token blacklisted by another
+        # process is seen within BLACKLIST_CACHE_REFRESH seconds
+        if self.payload[api_settings.JTI_CLAIM] in blacklisted_tokens:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklisted = super(UserRefreshToken, self).blacklist()
+        blacklisted_tokens.add(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+        return blacklisted
+
+
+def issue_tokens(user, endpoint):
+    return issue_tokens_bulk([user], endpoint)[0]
+
+
+def issue_tokens_bulk(users, endpoint):
+    # One refresh/access pair per user, each signed once, and one INSERT for all of their
+    # outstanding token records (token_blacklist needs them to blacklist on logout)
+    tokens = [(user, UserRefreshToken.for_user(user)) for user in users]
+    pairs = [{"access": str(refresh.access_token), "refresh_token": str(refresh)} for _, refresh in tokens]
+
+    if apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+        OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=refresh['jti'], token=pair["refresh_token"],
+                             created_at=refresh.current_time, expires_at=datetime_from_epoch(refresh['exp']))
+            for (user, refresh), pair in zip(tokens, pairs)
+        ])
+
+    TOKENS_MINTED.labels(endpoint).inc(len(pairs))
+    return pairs
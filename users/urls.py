@@ -1,10 +1,14 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views, views
 from .views import CreateUserView, VerifyApiView, GetNewVerification, ChangeUserInformationView, \
-    ChangeUserPhotoView, LoginView, LoginRefreshView, LogoutView, ForgetPasswordView, ResetPasswordView
+    ChangeUserPhotoView, LoginRefreshView, LogoutView, ForgetPasswordView, ResetPasswordView, FollowApiView
 
+# ASGI deployments (config/asgi.py) hash login passwords off the event loop
+login_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('login/', LoginView.as_view(), name="login"),
+    path('login/', login_views.LoginView.as_view(), name="login"),
     path('login/refresh/', LoginRefreshView.as_view(),name="login_refresh"),
     path('logout/', LogoutView.as_view(), name="logout"),
     path('forget/password/', ForgetPasswordView.as_view(), name="forget_password"),
@@ -14,4 +18,5 @@ urlpatterns = [
     path('verify/resent/', GetNewVerification.as_view(), name="verify_resent"),
     path('change/', ChangeUserInformationView.as_view(), name="change_user"),
     path('change/photo/', ChangeUserPhotoView.as_view(), name="change_photo"),
+    path('<uuid:pk>/follow/', FollowApiView.as_view(), name="follow"),
 ]
\ No newline at end of file
@@ -1,22 +1,24 @@
-from tokenize import TokenError
-
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import status
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from rest_framework.generics import CreateAPIView, UpdateAPIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from shared.utility import send_email, send_phone, check_email_or_phone
+from shared.utility import send_email, send_phone
 from .serializers import SignUpSerializers, ChangeUserInformation, ChangeUserPhotoSerializers, LoginSerializers,\
     LoginRefreshSerializer, LogoutSerializer, ForgetPasswordSerializer, ResetPasswordSerializer
 
+from .identity import EMAIL, PHONE
+from .tokens import UserRefreshToken
 from .models import User,  NEW, CODE_VERIFIED, DONE ,PHOTO_STEP, VIA_EMAIL, VIA_PHONE
 from datetime import datetime
 from rest_framework.views import APIView
-from .tasks import send_email_task, send_phone_task
+from post.tasks import backfill_feed_task, remove_author_from_feed_task
 
 
 class CreateUserView(CreateAPIView):
@@ -37,11 +39,12 @@ class VerifyApiView(APIView):
             # Agar xato bo'lsa, xato ma'lumotni qaytaramiz
             raise check_result  # ValidationError'ni raise qilamiz
 
+        tokens = user.token("verify")
         data = {
             "success": True,
             "auth_status": user.auth_status,
-            "access": user.token()["access"] if user.token() else None,
-            "refresh": user.token()["refresh_token"] if user.token() else None
+            "access": tokens["access"],
+            "refresh": tokens["refresh_token"]
         }
 
         return Response(data)
@@ -87,10 +90,10 @@ class GetNewVerification(APIView):
         self.check_verification(user)
         if user.auth_type == VIA_EMAIL:
             code = user.create_verify_code(VIA_EMAIL)
-            send_email_task.delay(user.email, code)
+            send_email(user.email, code)
         elif user.auth_type == VIA_PHONE:
             code = user.create_verify_code(VIA_PHONE)
-            send_phone_task.delay(user.phone, code)
+            send_phone(user.phone, code)
         else:
             data = {
                 "success":False,
@@ -186,7 +189,7 @@ class LogoutView(APIView):
         serializer.is_valid(raise_exception=True)
         try:
             refresh_token = self.request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = UserRefreshToken(refresh_token)
             token.blacklist()
 
             data = {
@@ -207,18 +210,21 @@ class ForgetPasswordView(APIView):
         serializer.is_valid(raise_exception=True)
         email_or_phone = serializer.validated_data.get("email_or_phone")
         user = serializer.validated_data.get("user")
-        if check_email_or_phone(email_or_phone) == "phone":
+        # Classified once by the serializer's lookup
+        input_type = serializer.validated_data.get("input_type")
+        if input_type == PHONE:
             code = user.create_verify_code(VIA_PHONE)
             send_phone(email_or_phone, code)
-        elif check_email_or_phone(email_or_phone) == "email":
+        elif input_type == EMAIL:
             code = user.create_verify_code(VIA_EMAIL)
             send_email(email_or_phone, code)
 
+        tokens = user.token("forget_password")
         data = {
             "success":True,
             "message":"Your confirmed code successfully send.",
-            "access":user.token()["access"],
-            "refresh":user.token()["refresh_token"],
+            "access":tokens["access"],
+            "refresh":tokens["refresh_token"],
             "user_status": user.auth_status
         }
         return Response(data, status=status.HTTP_200_OK)
@@ -238,10 +244,50 @@ class ResetPasswordView(UpdateAPIView):
         except ObjectDoesNotExist as e:
             raise NotFound(detail="User Not Found.")
 
+        tokens = user.token("reset_password")
         data = {
             "success":True,
             "message":"Password successfully updated",
-            "access":user.token()['access'],
-            "refresh":user.token()["refresh_token"]
+            "access":tokens['access'],
+            "refresh":tokens["refresh_token"]
         }
         return Response(data)
+
+
+class FollowApiView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        author = get_object_or_404(User, id=pk)
+        if author.id == request.user.id:
+            data = {
+                "success":False,
+                "message":"You cannot follow yourself."
+            }
+            raise ValidationError(data)
+
+        if request.user.follow(author):
+            transaction.on_commit(lambda: backfill_feed_task.delay(request.user.id, author.id))
+            data = {
+                "success":True,
+                "message":f"You are now following {author.username}."
+            }
+            return Response(data, status=status.HTTP_201_CREATED)
+
+        data = {
+            "success":True,
+            "message":f"You are already following {author.username}."
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    def delete(self, request, pk):
+        author = get_object_or_404(User, id=pk)
+        if not request.user.unfollow(author):
+            raise NotFound(detail="You are not following this user.")
+
+        transaction.on_commit(lambda: remove_author_from_feed_task.delay(request.user.id, author.id))
+        data = {
+            "success":True,
+            "message":f"You unfollowed {author.username}."
+        }
+        return Response(data, status=status.HTTP_200_OK)